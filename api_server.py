@@ -0,0 +1,527 @@
+# api_server.py
+import os
+import json
+import time
+import signal
+import argparse
+import threading
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from config import get_api_key
+from gemini_client import CHAT_MODEL, DeadlineExceededError, get_guard, split_quota
+from index_manager import current_index_path, current_version, get_or_create_current_index, IndexReloader
+from enhanced_chatbot_logic import build_enhanced_rag_chain
+from stock_store import StockStore
+from facts_store import FactsStore
+from cache_warmer import QUERY_LOG_PATH, build_warmup_questions, load_precomputed, start_cache_warming
+
+DATA_FOLDER = "data"
+DB_FOLDER = "chroma_db"
+STOCK_STORE_FOLDER = "stock_store"
+FACTS_STORE_FOLDER = "facts_store"
+
+DEFAULT_PORT = 8000
+DEFAULT_DEADLINE = 60.0
+MAX_DEADLINE = 300.0
+MAX_BODY_BYTES = 1024 * 1024
+MAX_QUESTION_CHARS = 2000
+MAX_BATCH_QUESTIONS = 20
+HEARTBEAT_INTERVAL = 5.0
+SOURCE_PREVIEW_CHARS = 300
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# HTTP API around EnhancedBajajChatbot.
+#
+#     POST /answer          {"question": ..., "deadline": 30}  -> answer and sources
+#     POST /answer/stream   same body, answered as server-sent events
+#     POST /batch           {"questions": [...], "deadline": 60} -> one result per question
+#     GET  /health          liveness
+#     GET  /ready           readiness (index loaded, chat model circuit not open)
+#     GET  /metrics         Prometheus text format, per worker process
+#
+# The parent process binds the socket and forks the worker processes, which
+# accept connections from it in turn. Each worker loads the published index
+# read-only (indexes are built and published by rebuild_database.py; workers
+# only follow the `current` pointer) and answers through a bounded pool:
+# questions beyond the pool's queue are rejected with 503 and questions that
+# miss their deadline get 504.
+
+
+class ServerBusyError(Exception):
+    """Raised when the answer pool has no free slot."""
+
+
+class AnswerPool:
+    """
+    Bounded worker pool: `workers` questions are answered at a time and up to
+    `queue_size` more wait. Further submissions are rejected at once, and
+    queued questions whose deadline passes before a worker picks them up are
+    dropped unanswered. Running questions stop waiting for generation at
+    their deadline.
+    """
+
+    def __init__(self, chatbot, workers=4, queue_size=16):
+        self.chatbot = chatbot
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.active = 0
+        self.queued = 0
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="answer-worker")
+
+    def submit(self, question, deadline_at):
+        if not self._slots.acquire(blocking=False):
+            raise ServerBusyError("Too many questions in progress; please retry shortly.")
+        with self._lock:
+            self.queued += 1
+        future = self._executor.submit(self._run, question, deadline_at)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, question, deadline_at):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            if time.monotonic() >= deadline_at:
+                raise TimeoutError("deadline passed while the question was queued")
+            # Generation gives up at the request deadline, freeing the slot and quota
+            return self.chatbot.answer_question(question, deadline_at=deadline_at)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class Metrics:
+    """Request counters and latency histograms for one worker process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.rejected = 0
+        self.deadline_exceeded = 0
+
+    def observe(self, endpoint, status, elapsed):
+        with self._lock:
+            key = (endpoint, int(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            buckets, total, count = self.latency.get(endpoint, ([0] * len(LATENCY_BUCKETS), 0.0, 0))
+            buckets = [n + (elapsed <= bound) for n, bound in zip(buckets, LATENCY_BUCKETS)]
+            self.latency[endpoint] = (buckets, total + elapsed, count + 1)
+            if status == HTTPStatus.SERVICE_UNAVAILABLE:
+                self.rejected += 1
+            elif status == HTTPStatus.GATEWAY_TIMEOUT:
+                self.deadline_exceeded += 1
+
+    def render(self, state):
+        pid = os.getpid()
+        lines = [
+            "# HELP chatbot_requests_total HTTP requests by endpoint and status.",
+            "# TYPE chatbot_requests_total counter",
+        ]
+        with self._lock:
+            for (endpoint, status), count in sorted(self.requests.items()):
+                lines.append(f'chatbot_requests_total{{pid="{pid}",endpoint="{endpoint}",status="{status}"}} {count}')
+            lines += [
+                "# HELP chatbot_request_duration_seconds Request latency by endpoint.",
+                "# TYPE chatbot_request_duration_seconds histogram",
+            ]
+            for endpoint, (buckets, total, count) in sorted(self.latency.items()):
+                labels = f'pid="{pid}",endpoint="{endpoint}"'
+                for bound, n in zip(LATENCY_BUCKETS, buckets):
+                    lines.append(f'chatbot_request_duration_seconds_bucket{{{labels},le="{bound}"}} {n}')
+                lines.append(f'chatbot_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'chatbot_request_duration_seconds_sum{{{labels}}} {total:.6f}')
+                lines.append(f'chatbot_request_duration_seconds_count{{{labels}}} {count}')
+            rejected, deadline_exceeded = self.rejected, self.deadline_exceeded
+
+        pool = state.pool
+        circuit_open = int(get_guard(CHAT_MODEL).breaker.state == "open")
+        lines += [
+            "# TYPE chatbot_rejected_total counter",
+            f'chatbot_rejected_total{{pid="{pid}"}} {rejected}',
+            "# TYPE chatbot_deadline_exceeded_total counter",
+            f'chatbot_deadline_exceeded_total{{pid="{pid}"}} {deadline_exceeded}',
+            "# TYPE chatbot_pool_active gauge",
+            f'chatbot_pool_active{{pid="{pid}"}} {pool.active}',
+            "# TYPE chatbot_pool_queued gauge",
+            f'chatbot_pool_queued{{pid="{pid}"}} {pool.queued}',
+            "# TYPE chatbot_pool_capacity gauge",
+            f'chatbot_pool_capacity{{pid="{pid}"}} {pool.capacity}',
+            "# TYPE chatbot_circuit_open gauge",
+            f'chatbot_circuit_open{{pid="{pid}",model="{CHAT_MODEL}"}} {circuit_open}',
+            "# TYPE chatbot_index_info gauge",
+            f'chatbot_index_info{{pid="{pid}",version="{state.reloader.version or "legacy"}"}} 1',
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class ServerState:
+    """Everything one worker process serves from."""
+
+    def __init__(self, chatbot, pool, reloader, default_deadline=DEFAULT_DEADLINE):
+        self.chatbot = chatbot
+        self.pool = pool
+        self.reloader = reloader
+        self.default_deadline = default_deadline
+        self.metrics = Metrics()
+        self.started_at = time.time()
+
+
+class BadRequestError(Exception):
+    def __init__(self, message, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+def serialize_sources(sources):
+    return [
+        {
+            "source": doc.metadata.get("source"),
+            "type": doc.metadata.get("type"),
+            "relevance_score": doc.metadata.get("relevance_score"),
+            "preview": doc.page_content[:SOURCE_PREVIEW_CHARS],
+        }
+        for doc in sources
+    ]
+
+
+class ChatbotRequestHandler(BaseHTTPRequestHandler):
+    server_version = "BajajChatbot/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.access_log:
+            super().log_message(format, *args)
+
+    # --- routing ---
+
+    def do_GET(self):
+        routes = {"/health": self.handle_health, "/ready": self.handle_ready, "/metrics": self.handle_metrics}
+        self.dispatch(routes)
+
+    def do_POST(self):
+        routes = {"/answer": self.handle_answer, "/answer/stream": self.handle_stream, "/batch": self.handle_batch}
+        self.dispatch(routes)
+
+    def dispatch(self, routes):
+        endpoint = self.path.split("?", 1)[0].rstrip("/") or "/"
+        handler = routes.get(endpoint)
+        start = time.monotonic()
+        if handler is None:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint {endpoint}"})
+            return
+        try:
+            status = handler()
+        except (BrokenPipeError, ConnectionResetError):
+            status = 499  # client closed the connection
+        except BadRequestError as e:
+            status = self.send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            print(f"❌ Error handling {endpoint}: {e}")
+            status = self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal server error"})
+        self.state.metrics.observe(endpoint, status, time.monotonic() - start)
+
+    # --- helpers ---
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        return status
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise BadRequestError("Request body too large", HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise BadRequestError("Request body must be JSON")
+        if not isinstance(payload, dict):
+            raise BadRequestError("Request body must be a JSON object")
+        return payload
+
+    def parse_question(self, value):
+        if not isinstance(value, str) or not value.strip():
+            raise BadRequestError("'question' must be a non-empty string")
+        if len(value) > MAX_QUESTION_CHARS:
+            raise BadRequestError(f"'question' is longer than {MAX_QUESTION_CHARS} characters")
+        return value.strip()
+
+    def parse_deadline(self, payload):
+        """Absolute monotonic deadline for the request."""
+        deadline = payload.get("deadline", self.state.default_deadline)
+        if not isinstance(deadline, (int, float)) or not 0 < deadline <= MAX_DEADLINE:
+            raise BadRequestError(f"'deadline' must be a number of seconds between 0 and {MAX_DEADLINE:.0f}")
+        return time.monotonic() + deadline
+
+    def busy(self, error):
+        return self.send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)}, {"Retry-After": "1"})
+
+    def timed_out(self):
+        return self.send_json(HTTPStatus.GATEWAY_TIMEOUT, {"error": "The question was not answered before its deadline"})
+
+    # --- endpoints ---
+
+    def handle_health(self):
+        return self.send_json(HTTPStatus.OK, {"status": "ok", "pid": os.getpid()})
+
+    def handle_ready(self):
+        circuit = get_guard(CHAT_MODEL).breaker.state
+        ready = self.state.chatbot.vector_store is not None and circuit != "open"
+        payload = {
+            "status": "ready" if ready else "unavailable",
+            "pid": os.getpid(),
+            "index_version": self.state.reloader.version,
+            "chat_model_circuit": circuit,
+            "active": self.state.pool.active,
+            "queued": self.state.pool.queued,
+            "uptime": round(time.time() - self.state.started_at),
+        }
+        return self.send_json(HTTPStatus.OK if ready else HTTPStatus.SERVICE_UNAVAILABLE, payload)
+
+    def handle_metrics(self):
+        body = self.state.metrics.render(self.state).encode("utf-8")
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return HTTPStatus.OK
+
+    def handle_answer(self):
+        payload = self.read_json()
+        question = self.parse_question(payload.get("question"))
+        deadline_at = self.parse_deadline(payload)
+        start = time.monotonic()
+        try:
+            future = self.state.pool.submit(question, deadline_at)
+            answer, sources = future.result(timeout=max(0.0, deadline_at - time.monotonic()))
+        except ServerBusyError as e:
+            return self.busy(e)
+        except (FutureTimeoutError, TimeoutError, DeadlineExceededError):
+            return self.timed_out()
+        return self.send_json(HTTPStatus.OK, {
+            "question": question,
+            "answer": answer,
+            "sources": serialize_sources(sources),
+            "elapsed": round(time.monotonic() - start, 3),
+        })
+
+    def handle_stream(self):
+        """
+        Server-sent events: `queued`, heartbeat comments while the answer is
+        being computed, the answer in paragraph-sized `answer` events, then
+        `sources` and `done` (or a single `error`).
+        """
+        payload = self.read_json()
+        question = self.parse_question(payload.get("question"))
+        deadline_at = self.parse_deadline(payload)
+        try:
+            future = self.state.pool.submit(question, deadline_at)
+        except ServerBusyError as e:
+            return self.busy(e)
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self.send_event("queued", {"question": question})
+            while True:
+                remaining = deadline_at - time.monotonic()
+                try:
+                    answer, sources = future.result(timeout=max(0.0, min(HEARTBEAT_INTERVAL, remaining)))
+                    break
+                except FutureTimeoutError:
+                    if remaining <= HEARTBEAT_INTERVAL:
+                        raise
+                    self.send_chunk(b": keep-alive\n\n")
+            for paragraph in answer.split("\n\n"):
+                self.send_event("answer", {"text": paragraph + "\n\n"})
+            self.send_event("sources", {"sources": serialize_sources(sources)})
+            self.send_event("done", {})
+            status = HTTPStatus.OK
+        except (FutureTimeoutError, TimeoutError, DeadlineExceededError):
+            self.send_event("error", {"error": "The question was not answered before its deadline"})
+            status = HTTPStatus.GATEWAY_TIMEOUT
+        except Exception as e:
+            print(f"❌ Error streaming answer: {e}")
+            self.send_event("error", {"error": "Internal server error"})
+            status = HTTPStatus.INTERNAL_SERVER_ERROR
+        self.send_chunk(b"")
+        return status
+
+    def send_event(self, event, data):
+        self.send_chunk(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def send_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def handle_batch(self):
+        payload = self.read_json()
+        questions = payload.get("questions")
+        if not isinstance(questions, list) or not questions:
+            raise BadRequestError("'questions' must be a non-empty list")
+        if len(questions) > MAX_BATCH_QUESTIONS:
+            raise BadRequestError(f"At most {MAX_BATCH_QUESTIONS} questions per batch")
+        questions = [self.parse_question(q) for q in questions]
+        deadline_at = self.parse_deadline(payload)
+
+        # Questions that do not fit in the pool are reported as busy, not queued
+        futures = []
+        for question in questions:
+            try:
+                futures.append(self.state.pool.submit(question, deadline_at))
+            except ServerBusyError as e:
+                futures.append(e)
+
+        results = []
+        for question, future in zip(questions, futures):
+            if isinstance(future, ServerBusyError):
+                results.append({"question": question, "error": str(future)})
+                continue
+            try:
+                answer, sources = future.result(timeout=max(0.0, deadline_at - time.monotonic()))
+                results.append({"question": question, "answer": answer, "sources": serialize_sources(sources)})
+            except (FutureTimeoutError, TimeoutError, DeadlineExceededError):
+                results.append({"question": question, "error": "The question was not answered before its deadline"})
+            except Exception as e:
+                print(f"❌ Error answering batch question: {e}")
+                results.append({"question": question, "error": "Internal server error"})
+        return self.send_json(HTTPStatus.OK, {"results": results})
+
+
+class ChatbotHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+    access_log = False
+    state = None
+
+
+def run_worker(server, api_key, processes=1, threads=4, queue_size=16, deadline=DEFAULT_DEADLINE, warmup=False):
+    """Load the chatbot in this process and serve requests from the shared socket."""
+    if processes > 1:
+        split_quota(processes)
+
+    vector_store = get_or_create_current_index(DATA_FOLDER, DB_FOLDER, api_key)
+    if vector_store is None:
+        print("❌ Failed to load the vector database.")
+        return
+    stock_store = StockStore(STOCK_STORE_FOLDER)
+    facts_store = FactsStore(FACTS_STORE_FOLDER)
+    chatbot = build_enhanced_rag_chain(vector_store, api_key, stock_store=stock_store, facts_store=facts_store)
+    chatbot.query_log_path = QUERY_LOG_PATH
+    load_precomputed(chatbot, index_version=current_version(DB_FOLDER))
+    if warmup:
+        start_cache_warming(chatbot, build_warmup_questions(QUERY_LOG_PATH))
+    reloader = IndexReloader(DB_FOLDER, chatbot, api_key).start()
+
+    server.state = ServerState(chatbot, AnswerPool(chatbot, threads, queue_size), reloader, deadline)
+    print(f"✅ Worker {os.getpid()} ready")
+    server.serve_forever()
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, processes=1, threads=4, queue_size=16,
+          deadline=DEFAULT_DEADLINE, warmup=False, access_log=False):
+    """
+    Bind the API socket and serve it from `processes` worker processes
+    (forked, POSIX only; a single process elsewhere). Crashed workers are
+    restarted.
+    """
+    try:
+        api_key = get_api_key()
+    except ValueError as e:
+        print(f"❌ Error: {e}")
+        return
+
+    # Workers only read the index; building one is rebuild_database.py's job
+    if current_index_path(DB_FOLDER) is None:
+        print("❌ No published index found. Run 'python rebuild_database.py' first.")
+        return
+
+    # Partition stock price files and extract reported figures once, before
+    # forking; workers only read them
+    StockStore(STOCK_STORE_FOLDER).ingest_folder(DATA_FOLDER)
+    FactsStore(FACTS_STORE_FOLDER).ingest_folder(DATA_FOLDER)
+
+    server = ChatbotHTTPServer((host, port), ChatbotRequestHandler)
+    server.access_log = access_log
+    worker_args = (server, api_key, processes, threads, queue_size, deadline, warmup)
+    print(f"🌐 Serving on http://{host}:{port} ({processes} process(es), {threads} threads, queue {queue_size})")
+
+    if processes <= 1 or not hasattr(os, "fork"):
+        try:
+            run_worker(*worker_args)
+        except KeyboardInterrupt:
+            print("\n👋 Shutting down.")
+        return
+
+    def fork_worker():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                run_worker(*worker_args)
+            finally:
+                os._exit(1)
+        return pid
+
+    workers = {fork_worker() for _ in range(processes)}
+    stopping = [False]
+
+    def stop(signum, frame):
+        stopping[0] = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping[0]:
+            print(f"⚠️  Worker {pid} exited (status {status}); restarting")
+            time.sleep(1)
+            workers.add(fork_worker())
+    server.server_close()
+    print("👋 Shutting down.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP API for the Bajaj Finserv chatbot.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--processes", type=int, default=1, help="worker processes sharing the socket and index")
+    parser.add_argument("--threads", type=int, default=4, help="questions answered at once per process")
+    parser.add_argument("--queue", type=int, default=16, help="questions allowed to wait per process before 503s")
+    parser.add_argument("--deadline", type=float, default=DEFAULT_DEADLINE, help="default per-request deadline (s)")
+    parser.add_argument("--warmup", action="store_true", help="warm each process's answer cache at startup")
+    parser.add_argument("--access-log", action="store_true", help="log every request")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.processes, args.threads, args.queue, args.deadline, args.warmup, args.access_log)
@@ -0,0 +1,206 @@
+# cache_warmer.py
+import os
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from langchain.schema import Document
+from enhanced_chatbot_logic import EXAMPLE_QUESTIONS, QUICK_EXAMPLES, normalize_question
+
+QUERY_LOG_PATH = os.path.join("logs", "query_log.jsonl")
+PRECOMPUTED_PATH = os.path.join("logs", "precomputed_answers.json")
+TOP_N_LOGGED = 20
+# Precomputed answers older than this are ignored at startup; loaded ones are
+# served until they reach this age (or the index is reloaded), not for the
+# shorter answer cache TTL
+PRECOMPUTED_MAX_AGE = 36 * 60 * 60
+# Startup warm-up in a serving process spends at most this share of the
+# process's chat quota, and only while no user question needs the model
+WARMUP_QUOTA_SHARE = 0.25
+# How often a paused warm-up checks whether the chat model is idle again
+WARMUP_IDLE_POLL = 1.0
+
+
+def top_logged_questions(query_log_path=QUERY_LOG_PATH, top_n=TOP_N_LOGGED):
+    """Most frequently asked questions in the query log, most common first."""
+    if not top_n or not os.path.exists(query_log_path):
+        return []
+    counts = Counter()
+    wording = {}
+    with open(query_log_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                question = json.loads(line)["question"]
+            except (ValueError, KeyError):
+                continue
+            key = normalize_question(question)
+            counts[key] += 1
+            wording.setdefault(key, question)
+    return [wording[key] for key, _ in counts.most_common(top_n)]
+
+
+def build_warmup_questions(query_log_path=QUERY_LOG_PATH, top_n=TOP_N_LOGGED, extra_questions=None):
+    """Built-in examples, then the top-N logged questions, then any extras (deduplicated)."""
+    questions = [q for group in EXAMPLE_QUESTIONS.values() for q in group] + list(QUICK_EXAMPLES)
+    questions += top_logged_questions(query_log_path, top_n)
+    questions += list(extra_questions or [])
+
+    seen = set()
+    unique = []
+    for question in questions:
+        key = normalize_question(question)
+        if key not in seen:
+            seen.add(key)
+            unique.append(question)
+    return unique
+
+
+def warm_cache(chatbot, questions, max_workers=2):
+    """Answer every question so the answer and retrieval caches are filled. Returns the results."""
+    def answer(question):
+        try:
+            return question, chatbot.answer_question(question, log=False)
+        except Exception as e:
+            print(f"❌ Warm-up failed for '{question}': {e}")
+            return question, None
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cache-warmer") as pool:
+        results = [r for r in pool.map(answer, questions) if r[1] is not None]
+    print(f"🔥 Warmed caches with {len(results)}/{len(questions)} questions")
+    return results
+
+
+def uncached_questions(chatbot, questions):
+    """Questions with no unexpired cached answer, e.g. one loaded from the precomputed file."""
+    return [
+        q for q in questions
+        if chatbot.cached_answer(q, chatbot.classify_query(q), max_age=chatbot.answer_cache_ttl) is None
+    ]
+
+
+def warm_cache_in_background(chatbot, questions, quota_share=WARMUP_QUOTA_SHARE):
+    """
+    Answer the questions that are not cached yet one at a time, at most
+    `quota_share` of the chat model's request rate and only while the model
+    has no user calls running or waiting, so user traffic always goes first.
+    """
+    questions = uncached_questions(chatbot, questions)
+    guard = chatbot.llm_guard
+    interval = 60.0 / (guard.settings["requests_per_minute"] * quota_share)
+    warmed = 0
+    for question in questions:
+        while not guard.idle():
+            time.sleep(WARMUP_IDLE_POLL)
+        try:
+            chatbot.answer_question(question, log=False)
+            warmed += 1
+        except Exception as e:
+            print(f"❌ Warm-up failed for '{question}': {e}")
+        time.sleep(interval)
+    print(f"🔥 Warmed caches with {warmed}/{len(questions)} uncached questions")
+    return warmed
+
+
+def start_cache_warming(chatbot, questions, quota_share=WARMUP_QUOTA_SHARE):
+    """Warm the caches in a low-priority background thread so startup is not delayed."""
+    thread = threading.Thread(
+        target=warm_cache_in_background, args=(chatbot, questions, quota_share),
+        name="cache-warmer", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def save_precomputed(chatbot, results, path=PRECOMPUTED_PATH, index_version=None):
+    """Write generated answers (not stock fast-path answers, which are instant) to disk."""
+    entries = []
+    for question, (answer, sources) in results:
+        if not sources or answer.startswith(("⚠️", "An error occurred")):
+            continue
+        entries.append({
+            "question": question,
+            "query_type": chatbot.classify_query(question),
+            "answer": answer,
+            "sources": [{"page_content": d.page_content, "metadata": d.metadata} for d in sources],
+        })
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"computed_at": time.time(), "index_version": index_version, "answers": entries}, f)
+    os.replace(tmp_path, path)
+    print(f"💾 Saved {len(entries)} precomputed answers to {path}")
+    return len(entries)
+
+
+def load_precomputed(chatbot, path=PRECOMPUTED_PATH, index_version=None, max_age=PRECOMPUTED_MAX_AGE):
+    """Seed the chatbot's answer cache from a precompute run. Returns the number of answers loaded."""
+    if not os.path.exists(path):
+        return 0
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error reading precomputed answers: {e}")
+        return 0
+
+    if time.time() - data.get("computed_at", 0) > max_age:
+        print("⚠️  Precomputed answers are stale; skipping.")
+        return 0
+    if index_version and data.get("index_version") not in (None, index_version):
+        print("⚠️  Precomputed answers were built from another index version; skipping.")
+        return 0
+
+    expires_at = data["computed_at"] + max_age
+    for entry in data["answers"]:
+        sources = [Document(page_content=s["page_content"], metadata=s["metadata"]) for s in entry["sources"]]
+        chatbot.remember_answer(
+            entry["question"], entry["query_type"], entry["answer"], sources,
+            computed_at=data["computed_at"], expires_at=expires_at
+        )
+    print(f"⚡ Loaded {len(data['answers'])} precomputed answers")
+    return len(data["answers"])
+
+
+if __name__ == "__main__":
+    # Nightly precompute: answer the warm-up set and write the answers to disk
+    from config import get_api_key
+    from index_manager import get_or_create_current_index, current_version
+    from enhanced_chatbot_logic import build_enhanced_rag_chain
+    from stock_store import StockStore
+    from facts_store import FactsStore
+
+    parser = argparse.ArgumentParser(description="Precompute answers for the most common questions.")
+    parser.add_argument("--query-log", default=QUERY_LOG_PATH)
+    parser.add_argument("--top-n", type=int, default=TOP_N_LOGGED, help="number of top logged questions to include")
+    parser.add_argument("--questions-file", help="extra questions, one per line")
+    parser.add_argument("--output", default=PRECOMPUTED_PATH)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    DATA_FOLDER = "data"
+    DB_FOLDER = "chroma_db"
+    STOCK_STORE_FOLDER = "stock_store"
+    FACTS_STORE_FOLDER = "facts_store"
+
+    extra = []
+    if args.questions_file:
+        with open(args.questions_file, encoding="utf-8") as f:
+            extra = [line.strip() for line in f if line.strip()]
+
+    api_key = get_api_key()
+    vector_store = get_or_create_current_index(DATA_FOLDER, DB_FOLDER, api_key)
+    if vector_store is None:
+        print("❌ Failed to load vector database.")
+    else:
+        stock_store = StockStore(STOCK_STORE_FOLDER)
+        stock_store.ingest_folder(DATA_FOLDER)
+        facts_store = FactsStore(FACTS_STORE_FOLDER)
+        facts_store.ingest_folder(DATA_FOLDER)
+        chatbot = build_enhanced_rag_chain(vector_store, api_key, stock_store=stock_store, facts_store=facts_store)
+        questions = build_warmup_questions(args.query_log, args.top_n, extra)
+        print(f"🌙 Precomputing answers for {len(questions)} questions...")
+        results = warm_cache(chatbot, questions, max_workers=args.workers)
+        save_precomputed(chatbot, results, args.output, index_version=current_version(DB_FOLDER))
@@ -0,0 +1,135 @@
+# calibrate_relevance.py
+import json
+import argparse
+from datetime import datetime
+from collections import defaultdict
+from enhanced_chatbot_logic import EXAMPLE_QUESTIONS, RELEVANCE_THRESHOLDS_PATH
+
+# Questions the documents cannot answer, used when no labelled set is given
+OFF_TOPIC_QUESTIONS = [
+    "What's the weather going to be like in Pune tomorrow?",
+    "Write a short poem about the sea",
+    "Who won the cricket world cup in 2011?",
+    "How do I bake sourdough bread?",
+    "Explain quantum entanglement in simple terms",
+    "What is the capital of Australia?",
+    "Recommend a good science fiction novel",
+    "How many moons does Jupiter have?",
+]
+
+# Share of answerable questions that must still reach the LLM
+TARGET_RECALL = 0.95
+# Query types with fewer answerable questions than this use the overall threshold
+MIN_SAMPLES = 5
+
+
+def load_labelled_questions(path):
+    """Read a JSONL file of {"question": ..., "relevant": true|false} lines."""
+    labelled = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                labelled.append((entry["question"], bool(entry["relevant"])))
+    return labelled
+
+
+def default_labelled_questions():
+    """Built-in example questions (answerable) plus OFF_TOPIC_QUESTIONS."""
+    labelled = [(q, True) for group in EXAMPLE_QUESTIONS.values() for q in group]
+    return labelled + [(q, False) for q in OFF_TOPIC_QUESTIONS]
+
+
+def collect_scores(chatbot, labelled):
+    """(query_type, relevant, best relevance score) for every labelled question."""
+    samples = []
+    for question, relevant in labelled:
+        query_type = chatbot.classify_query(question)
+        sources = chatbot.retrieve_documents(chatbot.get_rag_chain(query_type), question)
+        best = max((doc.metadata["relevance_score"] for doc in sources), default=0.0)
+        samples.append((query_type, relevant, best))
+        print(f"{'✅' if relevant else '🚫'} {best:.3f}  [{query_type}] {question}")
+    return samples
+
+
+def pick_threshold(relevant_scores, target_recall=TARGET_RECALL):
+    """Highest threshold that still keeps `target_recall` of the answerable questions."""
+    if not relevant_scores:
+        return None
+    ordered = sorted(relevant_scores)
+    return ordered[int((1 - target_recall) * len(ordered))]
+
+
+def calibrate(samples, target_recall=TARGET_RECALL):
+    """Per-query-type thresholds plus the share of questions each would skip."""
+    by_type = defaultdict(list)
+    for query_type, relevant, best in samples:
+        by_type[query_type].append((relevant, best))
+
+    default = pick_threshold([best for _, relevant, best in samples if relevant], target_recall)
+    thresholds = {}
+    stats = {}
+    for query_type, entries in sorted(by_type.items()):
+        relevant_scores = [best for relevant, best in entries if relevant]
+        threshold = default
+        if len(relevant_scores) >= MIN_SAMPLES:
+            threshold = pick_threshold(relevant_scores, target_recall)
+        thresholds[query_type] = threshold
+        if threshold is None:
+            continue
+        irrelevant_scores = [best for relevant, best in entries if not relevant]
+        stats[query_type] = {
+            "answerable_kept": sum(s >= threshold for s in relevant_scores) / max(1, len(relevant_scores)),
+            "off_topic_skipped": sum(s < threshold for s in irrelevant_scores) / max(1, len(irrelevant_scores)),
+            "questions": len(entries),
+        }
+    return {"default": default, "thresholds": thresholds, "stats": stats}
+
+
+def save_thresholds(result, path=RELEVANCE_THRESHOLDS_PATH, target_recall=TARGET_RECALL, index_version=None):
+    result = dict(result)
+    result.update({
+        "target_recall": target_recall,
+        "index_version": index_version,
+        "calibrated_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"💾 Relevance thresholds written to {path}")
+
+
+if __name__ == "__main__":
+    from config import get_api_key
+    from index_manager import get_or_create_current_index, current_version
+    from enhanced_chatbot_logic import build_enhanced_rag_chain
+
+    parser = argparse.ArgumentParser(description="Calibrate per-query-type retrieval relevance thresholds.")
+    parser.add_argument("--questions", help='JSONL file of {"question": ..., "relevant": true|false} lines')
+    parser.add_argument("--output", default=RELEVANCE_THRESHOLDS_PATH)
+    parser.add_argument("--target-recall", type=float, default=TARGET_RECALL, help="share of answerable questions to keep")
+    parser.add_argument("--dry-run", action="store_true", help="print the thresholds without writing them")
+    args = parser.parse_args()
+
+    DATA_FOLDER = "data"
+    DB_FOLDER = "chroma_db"
+
+    api_key = get_api_key()
+    vector_store = get_or_create_current_index(DATA_FOLDER, DB_FOLDER, api_key)
+    if vector_store is None:
+        print("❌ Failed to load vector database.")
+    else:
+        chatbot = build_enhanced_rag_chain(vector_store, api_key)
+        labelled = load_labelled_questions(args.questions) if args.questions else default_labelled_questions()
+        result = calibrate(collect_scores(chatbot, labelled), args.target_recall)
+
+        print("\n" + "=" * 60)
+        for query_type, threshold in result["thresholds"].items():
+            stats = result["stats"].get(query_type)
+            line = f"{query_type:<20} threshold {threshold if threshold is None else round(threshold, 3)}"
+            if stats:
+                line += f"  kept {stats['answerable_kept']:.0%} answerable, skipped {stats['off_topic_skipped']:.0%} off-topic"
+            print(line)
+        print("=" * 60)
+
+        if not args.dry_run:
+            save_thresholds(result, args.output, args.target_recall, current_version(DB_FOLDER))
@@ -0,0 +1,100 @@
+# chat_history.py
+import os
+import json
+import time
+import uuid
+import threading
+
+CHAT_HISTORY_DIR = "chat_history"
+MAX_IN_MEMORY = 40
+# Spilled histories of sessions idle for longer than this are deleted
+HISTORY_MAX_AGE = 7 * 24 * 60 * 60
+
+
+class ChatHistory:
+    """
+    Chat history of one session with a bounded in-memory tail.
+
+    Messages are numbered from 0 in the order they were added. Only the
+    newest `max_in_memory` are kept in memory; older ones are appended to
+    `<root_dir>/<session_id>.jsonl` and read back by position (the byte
+    offset of each spilled message is kept) when an older page is shown.
+    Spilled messages never change, so pages of them can be cached.
+    """
+
+    def __init__(self, root_dir=CHAT_HISTORY_DIR, session_id=None, max_in_memory=MAX_IN_MEMORY):
+        self.root_dir = root_dir
+        self.session_id = session_id or uuid.uuid4().hex
+        self.max_in_memory = max_in_memory
+        self.path = os.path.join(root_dir, f"{self.session_id}.jsonl")
+        self._recent = []
+        self._offsets = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._offsets) + len(self._recent)
+
+    @property
+    def spilled(self):
+        """Number of messages stored on disk only."""
+        with self._lock:
+            return len(self._offsets)
+
+    def append(self, role, content):
+        with self._lock:
+            self._recent.append({"role": role, "content": content})
+            overflow = len(self._recent) - self.max_in_memory
+            if overflow > 0:
+                self._spill(self._recent[:overflow])
+                del self._recent[:overflow]
+
+    def _spill(self, messages):
+        os.makedirs(self.root_dir, exist_ok=True)
+        with open(self.path, "ab") as f:
+            for message in messages:
+                self._offsets.append(f.tell())
+                f.write(json.dumps(message).encode("utf-8") + b"\n")
+
+    def messages(self, start, end):
+        """Messages `start` to `end` (exclusive), from disk and/or memory."""
+        with self._lock:
+            spilled = len(self._offsets)
+            start, end = max(0, start), min(end, spilled + len(self._recent))
+            result = []
+            if start < min(end, spilled):
+                with open(self.path, "rb") as f:
+                    f.seek(self._offsets[start])
+                    for _ in range(min(end, spilled) - start):
+                        result.append(json.loads(f.readline()))
+            result.extend(self._recent[max(0, start - spilled):max(0, end - spilled)])
+            return result
+
+    def tail(self, count):
+        """The newest `count` messages."""
+        total = len(self)
+        return self.messages(total - count, total)
+
+    def clear(self):
+        """Forget every message and delete the spilled file."""
+        with self._lock:
+            self._recent = []
+            self._offsets = []
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def prune_chat_histories(root_dir=CHAT_HISTORY_DIR, max_age=HISTORY_MAX_AGE):
+    """Delete spilled histories not written to for `max_age` seconds. Returns the number removed."""
+    if not os.path.isdir(root_dir):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age
+    for filename in os.listdir(root_dir):
+        path = os.path.join(root_dir, filename)
+        if filename.endswith(".jsonl") and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
@@ -0,0 +1,134 @@
+# data_watcher.py
+import os
+import time
+import threading
+from enhanced_data_loader import load_file_enhanced, split_documents_enhanced
+from index_manager import build_staged_index
+from sharded_index import ShardedVectorStore, group_chunks_by_shard
+
+WATCHED_EXTENSIONS = (".pdf", ".csv")
+
+
+class DataFolderWatcher:
+    """
+    Background thread that polls the data folder and ingests files as they
+    change, without restarting the serving process.
+
+    A file is picked up once its size and modification time have stayed the
+    same for `debounce` seconds, so half-copied files are not ingested.
+    The index shards a changed file touches are rebuilt into a new index
+    version, validated and published (every process's IndexReloader then
+    switches to it); price files are re-partitioned in the chatbot's stock
+    store, reports are re-extracted into its facts store (if it has one),
+    and the chatbot's answer cache is cleared. Queries keep running against
+    the current data while an update is in progress.
+    """
+
+    def __init__(self, data_folder, chatbot, db_root, api_key, interval=2.0, debounce=3.0):
+        self.data_folder = data_folder
+        self.chatbot = chatbot
+        self.db_root = db_root
+        self.api_key = api_key
+        self.interval = interval
+        self.debounce = debounce
+        self._known = self._snapshot()
+        self._pending = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _snapshot(self):
+        """Map of watched file path -> (mtime, size)."""
+        snapshot = {}
+        if not os.path.isdir(self.data_folder):
+            return snapshot
+        for filename in os.listdir(self.data_folder):
+            if filename.endswith(WATCHED_EXTENSIONS):
+                filepath = os.path.join(self.data_folder, filename)
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    continue
+                snapshot[filepath] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="data-folder-watcher", daemon=True)
+            self._thread.start()
+            print(f"👀 Watching {self.data_folder} for new or changed files...")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"❌ Data watcher error: {e}")
+
+    def poll(self):
+        """Check the folder once and ingest files whose changes have settled."""
+        now = time.monotonic()
+        current = self._snapshot()
+
+        for filepath in set(current) | set(self._known):
+            signature = current.get(filepath)
+            if signature == self._known.get(filepath):
+                self._pending.pop(filepath, None)
+                continue
+            pending = self._pending.get(filepath)
+            if pending is None or pending[0] != signature:
+                # New change (or still being written): restart the debounce clock
+                self._pending[filepath] = (signature, now)
+            elif now - pending[1] >= self.debounce:
+                del self._pending[filepath]
+                self.ingest(filepath, deleted=signature is None)
+                if signature is None:
+                    self._known.pop(filepath, None)
+                else:
+                    self._known[filepath] = signature
+
+    def affected_shards(self, filepath, deleted=False):
+        """Shards that hold chunks of a file now or will hold them after it is re-ingested."""
+        shards = set()
+        vector_store = self.chatbot.vector_store
+        if isinstance(vector_store, ShardedVectorStore):
+            shards.update(vector_store.shards_with_source(os.path.basename(filepath)))
+        if not deleted:
+            shards.update(group_chunks_by_shard(split_documents_enhanced(load_file_enhanced(filepath))))
+        return sorted(shards)
+
+    def ingest(self, filepath, deleted=False):
+        """Publish an index version with the file's shards rebuilt and update the stores and caches."""
+        filename = os.path.basename(filepath)
+        print(f"📥 {'Removing' if deleted else 'Ingesting'} {filename}...")
+
+        try:
+            shards = self.affected_shards(filepath, deleted)
+            if shards and build_staged_index(self.data_folder, self.db_root, self.api_key, shards=shards) is None:
+                print(f"❌ Index for {filename} was not published; the live index is unchanged")
+        except Exception as e:
+            print(f"❌ Error rebuilding the index for {filename}: {e}")
+
+        if filename.endswith(".csv"):
+            if deleted:
+                self.chatbot.stock_store.remove_file(filepath)
+            else:
+                self.chatbot.refresh_stock_data(filepath)
+
+        if filename.endswith(".pdf") and self.chatbot.facts_store is not None:
+            try:
+                if deleted:
+                    self.chatbot.facts_store.remove_file(filepath)
+                else:
+                    self.chatbot.facts_store.ingest_file(filepath)
+            except Exception as e:
+                print(f"❌ Error updating financial facts for {filename}: {e}")
+
+        self.chatbot.invalidate_caches()
+        print(f"✅ {filename} {'removed' if deleted else 'is live'}")
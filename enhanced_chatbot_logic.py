@@ -1,42 +1,218 @@
 # enhanced_chatbot_logic.py
-import pandas as pd
+import os
+import json
+import time
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 from langchain_community.vectorstores import Chroma
 from langchain.schema import Document
+from gemini_client import CHAT_MODEL, DeadlineExceededError, GeminiUnavailableError, get_guard, get_chat_model
+from profiling import PROFILE_DIR, profile_run
+from stock_store import StockStore, display_name
+from facts_store import find_metrics, find_entities, find_periods, format_fact_value, has_unresolved_date
+
+# Generated answers are served from cache for ANSWER_CACHE_TTL seconds, and
+# for any age while Gemini is unavailable
+ANSWER_CACHE_SIZE = 256
+ANSWER_CACHE_TTL = 6 * 60 * 60
+RETRIEVAL_CACHE_SIZE = 512
+
+# Threads running vector retrieval speculatively alongside the stock fast path
+SPECULATIVE_WORKERS = 8
+
+# Stock questions containing these words also need the documents, so the
+# stock figures are passed to the LLM as extra context instead of returned
+MIXED_QUESTION_WORDS = [
+    'why', 'reason', 'impact', 'because', 'explain', 'driven', 'due to',
+    'results', 'performance', 'headwinds', 'partnership', 'strategy'
+]
+
+# Metric questions with these words get a period-over-period comparison
+COMPARISON_WORDS = [
+    'compare', 'comparison', 'vs', 'versus', 'growth', 'grow', 'grew', 'change',
+    'changed', 'increase', 'decrease', 'yoy', 'qoq', 'trend'
+]
+# Only questions phrased as a lookup or comparison are answered from the facts
+# store alone; narrative questions go to the LLM with the facts as context
+FACT_LOOKUP_WORDS = [
+    'what was', 'what were', 'what is', 'what are', 'how much', 'how did',
+    'how has', 'compare', 'comparison', 'vs', 'versus', 'growth', 'change',
+    'figure', 'figures', 'value', 'reported'
+]
+NARRATIVE_WORDS = [
+    'outlook', 'driver', 'drivers', 'commentary', 'draft', 'discuss',
+    'discussion', 'guidance', 'strategy', 'plan', 'plans', 'expect',
+    'expected', 'act as', 'summarize', 'summarise', 'rationale', 'view',
+    'going forward', 'target', 'concerns'
+]
+# Most lines in an answer from the facts store
+MAX_FACT_LINES = 15
+
+# Per-query-type relevance thresholds written by calibrate_relevance.py;
+# without the file every retrieved context is passed to the LLM
+RELEVANCE_THRESHOLDS_PATH = "relevance_thresholds.json"
+
+# Example questions shown in the CLI help and used to warm the caches at startup
+EXAMPLE_QUESTIONS = {
+    "📈 Stock Price Queries": [
+        "What was the highest stock price of Bajaj Finserv in 2022?",
+        "What was the average stock price in 2023?",
+        "What was the lowest stock price in January 2022?",
+        "Compare stock prices from 2022 to 2023",
+        "Bajaj Finance vs Bajaj Finserv stock price in 2023"
+    ],
+    "💼 Business Insights": [
+        "Why is BAGIC facing headwinds in motor insurance business?",
+        "What's the rationale of Hero partnership?",
+        "Tell me about organic traffic of Bajaj Markets",
+        "What are the discussions regarding Allianz stake sale?"
+    ],
+    "📊 Financial Analysis": [
+        "Act as a CFO of BAGIC and help me draft commentary for upcoming investor call",
+        "What are the key financial highlights from Q4 FY25?",
+        "Compare Bajaj Finserv performance from Q1 to Q4 FY25"
+    ],
+    "🔍 General Queries": [
+        "What products does Bajaj Finserv offer?",
+        "What are the key strategic initiatives?",
+        "How is the company performing in different business segments?"
+    ]
+}
+
+# Quick examples listed in the Streamlit sidebar
+QUICK_EXAMPLES = [
+    "What was the highest stock price in 2022?",
+    "What was the average stock price in 2023?",
+    "What was the lowest stock price in January 2022?",
+    "Compare stock prices from 2022 to 2023"
+]
+
+# Example category suggested when a question has no relevant context
+NO_CONTEXT_EXAMPLES = {
+    'stock_price': "📈 Stock Price Queries",
+    'stock_comparison': "📈 Stock Price Queries",
+    'financial_analysis': "📊 Financial Analysis",
+    'business_insights': "💼 Business Insights",
+}
+
+def normalize_question(question):
+    """Canonical form of a question used as a cache key."""
+    return re.sub(r'\s+', ' ', question.strip().lower()).rstrip('?.! ')
+
+def relevance_from_distance(distance):
+    """Cosine similarity of unit-length embeddings from Chroma's squared L2 distance."""
+    return 1.0 - distance / 2.0
+
+def load_relevance_thresholds(path=RELEVANCE_THRESHOLDS_PATH):
+    """Calibrated thresholds ({"default": ..., "thresholds": {query_type: ...}}), or {} if not calibrated."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading relevance thresholds: {e}")
+        return {}
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the
+    function, callers arriving while it runs wait and receive the same
+    result (or exception). Nothing is kept once the call completes.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+    
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+        
+        if not leader:
+            print("Joining in-flight request for the same question")
+            call["done"].wait()
+        else:
+            try:
+                call["result"] = fn(*args, **kwargs)
+            except BaseException as e:
+                call["error"] = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call["done"].set()
+        
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
 
 class EnhancedBajajChatbot:
-    def __init__(self, vector_store, api_key, stock_data_path=None):
+    """
+    Question answering over the vector store and stock price data.
+    
+    One instance is safe to share between threads: the chat model and
+    embedding clients are process-wide shared clients whose calls go through
+    the per-model guards, the stock store and caches are lock-protected,
+    RAG chains hold no per-request state, and `vector_store` is only ever
+    replaced as a whole (hot reload), never mutated in place by a query.
+    """
+    
+    def __init__(self, vector_store, api_key, stock_data_path=None, stock_store=None, llm=None, facts_store=None):
         self.vector_store = vector_store
         self.api_key = api_key
-        self.stock_data = None
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash", 
-            google_api_key=api_key, 
-            temperature=0.1
-        )
-        
-        # Load stock data if available
+        self.stock_store = stock_store if stock_store is not None else StockStore()
+        self.facts_store = facts_store
+        self.llm = llm if llm is not None else get_chat_model(api_key, temperature=0.1)
+        self.llm_guard = get_guard(CHAT_MODEL)
+        self._rag_chains = {}
+        self._rag_chains_lock = threading.Lock()
+        self._answer_cache = OrderedDict()
+        self._answer_cache_lock = threading.Lock()
+        self._retrieval_cache = OrderedDict()
+        self.retrieval_cache_size = RETRIEVAL_CACHE_SIZE
+        self.answer_cache_ttl = ANSWER_CACHE_TTL
+        self.query_log_path = None
+        self._query_log_lock = threading.Lock()
+        self._in_flight = SingleFlight()
+        self._speculative = ThreadPoolExecutor(max_workers=SPECULATIVE_WORKERS, thread_name_prefix="speculative-retrieval")
+        self.profile_dir = PROFILE_DIR
+        self.profile_all = False
+        self.relevance_thresholds = load_relevance_thresholds()
+        
+        # Register stock data if available; partitions are only loaded on first query
         if stock_data_path:
-            try:
-                self.stock_data = pd.read_csv(stock_data_path)
-                # Handle the date format in the CSV (e.g., "3-Jan-22")
-                self.stock_data['Date'] = pd.to_datetime(self.stock_data['Date'], format='%d-%b-%y')
-                print(f"Loaded stock data with {len(self.stock_data)} records")
-                print(f"Date range: {self.stock_data['Date'].min()} to {self.stock_data['Date'].max()}")
-            except Exception as e:
-                print(f"Error loading stock data: {e}")
-                # Try alternative date parsing
-                try:
-                    self.stock_data = pd.read_csv(stock_data_path)
-                    self.stock_data['Date'] = pd.to_datetime(self.stock_data['Date'])
-                    print(f"Loaded stock data with {len(self.stock_data)} records (alternative parsing)")
-                    print(f"Date range: {self.stock_data['Date'].min()} to {self.stock_data['Date'].max()}")
-                except Exception as e2:
-                    print(f"Failed to load stock data: {e2}")
+            if os.path.exists(stock_data_path):
+                self.stock_store.ingest_file(stock_data_path)
+            else:
+                print(f"Failed to load stock data: {stock_data_path} not found")
+    
+    @property
+    def stock_data(self):
+        """Price data for the default ticker (loaded lazily)."""
+        if not self.stock_store.tickers():
+            return None
+        return self.stock_store.get(self.stock_store.default_ticker())
+    
+    def refresh_stock_data(self, filepath):
+        """Re-ingest a changed price file; its tickers are reloaded on next use."""
+        tickers = self.stock_store.ingest_file(filepath, force=True)
+        self.invalidate_caches()
+        return tickers
+    
+    def invalidate_caches(self):
+        """Drop answers and retrieval results computed from data that may have changed."""
+        with self._answer_cache_lock:
+            self._answer_cache.clear()
+            self._retrieval_cache.clear()
     
     def classify_query(self, question):
         """Classify the type of query to apply appropriate handling."""
@@ -113,7 +289,7 @@ class EnhancedBajajChatbot:
     
     def get_stock_price_data(self, question):
         """Extract relevant stock price data based on the question."""
-        if self.stock_data is None:
+        if not self.stock_store.tickers():
             return "Stock price data not available."
         
         dates = self.extract_date_range(question)
@@ -123,61 +299,191 @@ class EnhancedBajajChatbot:
             return "No specific date range found in the question."
         
         try:
-            # Filter data based on extracted dates
-            filtered_data = self.stock_data.copy()
-            
-            # If year is mentioned, filter by year
-            years = [d for d in dates if len(d) == 4]
-            if years:
-                year = int(years[0])
-                filtered_data = filtered_data[filtered_data['Date'].dt.year == year]
-                print(f"Filtering data for year: {year}")
-            
-            # If month is mentioned, filter by month
-            months = []
-            for date in dates:
-                if len(date) == 3 and '-' in date:  # MMM-YY format
-                    try:
-                        month_str = date.split('-')[0]
-                        month_map = {
-                            'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
-                            'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
-                        }
-                        if month_str.lower() in month_map:
-                            months.append(month_map[month_str.lower()])
-                    except:
-                        pass
+            tickers = self.stock_store.resolve_tickers(question)
+            print(f"Resolved tickers: {tickers}")
             
-            if months:
-                filtered_data = filtered_data[filtered_data['Date'].dt.month.isin(months)]
-                print(f"Filtering data for months: {months}")
+            if len(tickers) == 1:
+                return self.summarize_stock_period(tickers[0], dates, question_lower)
             
-            if filtered_data.empty:
-                available_years = sorted(self.stock_data['Date'].dt.year.unique())
-                return f"No stock data available for the specified period. Available data: {available_years}"
-            
-            # Calculate statistics
-            highest = filtered_data['Close Price'].max()
-            lowest = filtered_data['Close Price'].min()
-            average = filtered_data['Close Price'].mean()
-            
-            # Get date range for context
-            start_date = filtered_data['Date'].min().strftime('%Y-%m-%d')
-            end_date = filtered_data['Date'].max().strftime('%Y-%m-%d')
-            
-            # Format response based on question type
-            if 'highest' in question_lower:
-                return f"📈 Highest stock price: ₹{highest:.2f} (Period: {start_date} to {end_date})"
-            elif 'lowest' in question_lower:
-                return f"📉 Lowest stock price: ₹{lowest:.2f} (Period: {start_date} to {end_date})"
-            elif 'average' in question_lower:
-                return f"📊 Average stock price: ₹{average:.2f} (Period: {start_date} to {end_date})"
-            else:
-                return f"📈 Stock Price Statistics (Period: {start_date} to {end_date}):\n- Highest: ₹{highest:.2f}\n- Lowest: ₹{lowest:.2f}\n- Average: ₹{average:.2f}"
+            # Multi-ticker question: one line per ticker, in order of mention
+            lines = []
+            for ticker in tickers:
+                name = f"{display_name(ticker)} ({ticker})"
+                stock_data = self.stock_store.get(ticker)
+                if stock_data is None:
+                    lines.append(f"- {name}: No price data loaded for this company.")
+                    continue
+                stats = self.filter_stock_period(stock_data, dates)
+                if stats is None:
+                    lines.append(f"- {name}: No stock data available for the specified period.")
+                else:
+                    highest, lowest, average, start_date, end_date = stats
+                    lines.append(
+                        f"- {name}: Highest ₹{highest:.2f}, Lowest ₹{lowest:.2f}, "
+                        f"Average ₹{average:.2f} (Period: {start_date} to {end_date})"
+                    )
+            return "📊 Stock Price Comparison:\n" + "\n".join(lines)
                 
         except Exception as e:
             return f"Error processing stock data: {str(e)}"
     
+    def get_financial_facts(self, question):
+        """
+        Answer a metric lookup or period-over-period comparison from the facts
+        extracted from the reports, citing file and page. Returns
+        (answer, fact documents), or (None, []) if the question names no known
+        metric, nothing was extracted for it, or it names a date the facts
+        store has no figures for.
+        """
+        if self.facts_store is None:
+            return None, []
+        metrics = find_metrics(question)
+        if not metrics or has_unresolved_date(question):
+            return None, []
+        
+        question_lower = question.lower()
+        periods = [label for label, _, _ in find_periods(question)]
+        entities = find_entities(question)
+        comparing = len(periods) >= 2 or any(re.search(rf'\b{word}\b', question_lower) for word in COMPARISON_WORDS)
+        sequential = any(word in question_lower for word in ['qoq', 'sequential', 'previous quarter'])
+        
+        try:
+            # Without a named period, comparisons need the history of every period
+            facts = self.facts_store.lookup(metrics, entities, periods)
+        except Exception as e:
+            print(f"Error querying facts store: {e}")
+            return None, []
+        if not facts or not set(periods) <= {fact["period"] for fact in facts}:
+            return None, []
+        
+        groups = OrderedDict()
+        for fact in facts:
+            groups.setdefault((fact["entity"], fact["metric"]), []).append(fact)
+        
+        lines = []
+        cited = []
+        for (entity, metric), history in groups.items():
+            if periods:
+                selected = history
+            else:
+                latest = history[-1]
+                previous = self.previous_fact(history, latest, sequential) if comparing else None
+                selected = [previous, latest] if previous else [latest]
+            
+            values = ", ".join(
+                f"{format_fact_value(f['value'], f['unit'])} ({f['period']})" for f in selected
+            )
+            line = f"- {entity} — {metric}: {values}"
+            if comparing and len(selected) >= 2:
+                line += f"; {self.describe_change(selected[0], selected[-1])}"
+            citations = sorted({f"{f['source']}, p. {f['page']}" for f in selected})
+            lines.append(f"{line} [{'; '.join(citations)}]")
+            cited.extend(selected)
+        
+        if len(lines) > MAX_FACT_LINES:
+            omitted = len(lines) - MAX_FACT_LINES
+            lines = lines[:MAX_FACT_LINES] + [f"- ... and {omitted} more; name a business or period to narrow this down."]
+        
+        documents = [
+            Document(
+                page_content=f["snippet"],
+                metadata={"source": f["source"], "page": f["page"], "type": "financial_fact"}
+            )
+            for f in cited
+        ]
+        return "🔢 **Reported Figures**\n" + "\n".join(lines), documents
+    
+    def previous_fact(self, history, latest, sequential=False):
+        """The fact to compare `latest` with: same period a year earlier, or the preceding one of the same kind."""
+        # "Q4 FY25" -> prefix "Q4", kind "Q"; "FY25" -> "FY"
+        prefix = lambda fact: fact["period"].split()[0] if " " in fact["period"] else "FY"
+        same_kind = [f for f in history if f is not latest and prefix(f)[0] == prefix(latest)[0]]
+        earlier = [f for f in same_kind if (f["fiscal_year"], f["fiscal_quarter"] or 0) < (latest["fiscal_year"], latest["fiscal_quarter"] or 0)]
+        if not sequential:
+            year_ago = [f for f in earlier if prefix(f) == prefix(latest) and f["fiscal_year"] == latest["fiscal_year"] - 1]
+            if year_ago:
+                return year_ago[-1]
+        return earlier[-1] if earlier else None
+    
+    def describe_change(self, old, new):
+        """Change between two facts: percentage points for ratios, percent for amounts."""
+        if new["unit"] == "%":
+            return f"{new['value'] - old['value']:+.2f} pp from {old['period']} to {new['period']}"
+        if not old["value"]:
+            return f"from {old['period']} to {new['period']}"
+        change = (new["value"] - old["value"]) / abs(old["value"]) * 100
+        return f"{change:+.1f}% from {old['period']} to {new['period']}"
+    
+    def summarize_stock_period(self, ticker, dates, question_lower):
+        """Format price statistics for a single ticker."""
+        name = f"{display_name(ticker)} ({ticker})"
+        stock_data = self.stock_store.get(ticker)
+        if stock_data is None:
+            loaded = ", ".join(display_name(t) for t in self.stock_store.tickers())
+            return f"No price data for {name} is loaded. Prices are available for: {loaded}"
+        
+        stats = self.filter_stock_period(stock_data, dates)
+        
+        if stats is None:
+            available_years = sorted(stock_data['Date'].dt.year.unique())
+            return f"No stock data available for {name} in the specified period. Available data: {available_years}"
+        
+        highest, lowest, average, start_date, end_date = stats
+        
+        # Format response based on question type
+        if 'highest' in question_lower:
+            return f"📈 Highest stock price of {name}: ₹{highest:.2f} (Period: {start_date} to {end_date})"
+        elif 'lowest' in question_lower:
+            return f"📉 Lowest stock price of {name}: ₹{lowest:.2f} (Period: {start_date} to {end_date})"
+        elif 'average' in question_lower:
+            return f"📊 Average stock price of {name}: ₹{average:.2f} (Period: {start_date} to {end_date})"
+        else:
+            return f"📈 Stock Price Statistics for {name} (Period: {start_date} to {end_date}):\n- Highest: ₹{highest:.2f}\n- Lowest: ₹{lowest:.2f}\n- Average: ₹{average:.2f}"
+    
+    def filter_stock_period(self, stock_data, dates):
+        """Filter price data to the extracted dates; returns (high, low, avg, start, end) or None."""
+        filtered_data = stock_data
+        
+        # If year is mentioned, filter by year
+        years = [d for d in dates if len(d) == 4]
+        if years:
+            year = int(years[0])
+            filtered_data = filtered_data[filtered_data['Date'].dt.year == year]
+            print(f"Filtering data for year: {year}")
+        
+        # If month is mentioned, filter by month
+        months = []
+        for date in dates:
+            if len(date) == 3 and '-' in date:  # MMM-YY format
+                try:
+                    month_str = date.split('-')[0]
+                    month_map = {
+                        'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+                        'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
+                    }
+                    if month_str.lower() in month_map:
+                        months.append(month_map[month_str.lower()])
+                except:
+                    pass
+        
+        if months:
+            filtered_data = filtered_data[filtered_data['Date'].dt.month.isin(months)]
+            print(f"Filtering data for months: {months}")
+        
+        if filtered_data.empty:
+            return None
+        
+        # Calculate statistics
+        highest = filtered_data['Close Price'].max()
+        lowest = filtered_data['Close Price'].min()
+        average = filtered_data['Close Price'].mean()
+        
+        # Get date range for context
+        start_date = filtered_data['Date'].min().strftime('%Y-%m-%d')
+        end_date = filtered_data['Date'].max().strftime('%Y-%m-%d')
+        
+        return highest, lowest, average, start_date, end_date
+    
     def build_enhanced_prompt(self, query_type):
         """Build enhanced prompts based on query type."""
         
@@ -277,35 +583,269 @@ class EnhancedBajajChatbot:
         
         return qa_chain
     
-    def answer_question(self, question):
-        """Enhanced question answering with query classification and specialized handling."""
-        try:
+    def get_rag_chain(self, query_type):
+        """Shared RAG chain for a query type, rebuilt when the vector store is swapped."""
+        vector_store = self.vector_store
+        with self._rag_chains_lock:
+            cached = self._rag_chains.get(query_type)
+            if cached is None or cached[0] is not vector_store:
+                cached = (vector_store, self.build_rag_chain(query_type))
+                self._rag_chains[query_type] = cached
+            return cached[1]
+    
+    def answer_question(self, question, profile=False, log=True, deadline_at=None):
+        """
+        Enhanced question answering with query classification and specialized handling.
+        
+        Concurrent calls with the same normalized question and query type share
+        one in-flight computation and all receive its result. With `profile`
+        (or `profile_all` set on the chatbot) a cProfile/tracemalloc report for
+        this question is written to `profile_dir`. Questions are appended to
+        the query log unless `log` is False (e.g. for cache warm-up). With
+        `deadline_at` (a time.monotonic() value) generation gives up at that
+        time instead of after the chat model's own deadline, and
+        DeadlineExceededError is raised. A caller that joined a computation
+        ended by another caller's shorter deadline computes the answer again
+        under its own deadline.
+        """
+        with profile_run(f"answer-{question}", self.profile_dir, enabled=profile or self.profile_all):
+            start_time = time.time()
+            
             # Classify the query
             query_type = self.classify_query(question)
             print(f"Query classified as: {query_type}")
             
-            # Handle stock price queries with structured data
+            cached = self.cached_answer(question, query_type, max_age=self.answer_cache_ttl)
+            if cached:
+                answer, sources = cached
+            else:
+                key = (normalize_question(question), query_type)
+                while True:
+                    try:
+                        answer, sources = self._in_flight.do(key, self.compute_answer, question, query_type, deadline_at)
+                        break
+                    except DeadlineExceededError:
+                        if deadline_at is not None and time.monotonic() >= deadline_at:
+                            raise
+                        print("Shared computation hit another caller's deadline; answering again")
+            
+            if log:
+                self.log_query(question, query_type, time.time() - start_time, cached=bool(cached))
+            return answer, sources
+    
+    def compute_answer(self, question, query_type, deadline_at=None):
+        """
+        Answer a classified question.
+        
+        Lookups and comparisons of a reported metric are answered from the
+        facts store without the LLM. For stock questions the structured lookup and the
+        vector retrieval run concurrently: a definitive stock answer is
+        returned at once and the retrieval is cancelled, otherwise generation
+        starts from the context that was already being retrieved. For mixed
+        questions the stock figures and reported facts are added to the LLM
+        context.
+        """
+        try:
+            # Metric lookups and comparisons come straight from the facts store
+            facts_response, fact_documents = self.get_financial_facts(question)
+            if facts_response and self.is_fact_lookup(question):
+                return facts_response, fact_documents
+            
+            # Get the RAG chain for this query type
+            rag_chain = self.get_rag_chain(query_type)
+            
+            # Retrieve context (embedding calls are guarded by the vector store's
+            # embedding function); stock questions retrieve speculatively while
+            # the structured data is queried
+            stock_response = None
             if query_type in ['stock_price', 'stock_comparison']:
+                retrieval = self._speculative.submit(self.retrieve_documents, rag_chain, question)
                 stock_response = self.get_stock_price_data(question)
-                if "Stock price data not available" not in stock_response and "No specific date range" not in stock_response:
+                if self.is_stock_answer(stock_response) and not self.is_mixed_question(question):
+                    retrieval.cancel()
                     return stock_response, []
+                sources = retrieval.result()
+            else:
+                sources = self.retrieve_documents(rag_chain, question)
+            
+            # Skip generation when no retrieved chunk is relevant enough
+            has_stock_figures = bool(stock_response and '₹' in stock_response)
+            threshold = self.relevance_threshold(query_type)
+            best = max((doc.metadata.get("relevance_score", 0.0) for doc in sources), default=None)
+            if threshold is not None and not has_stock_figures and not facts_response and (best is None or best < threshold):
+                print(f"Best relevance {best} is below {threshold:.3f}; not calling the LLM")
+                return self.no_context_answer(query_type), []
+            
+            if has_stock_figures:
+                stock_document = Document(
+                    page_content=stock_response,
+                    metadata={"source": "stock_store", "type": "stock_data"}
+                )
+                sources = [stock_document] + sources
             
-            # Build appropriate RAG chain
-            rag_chain = self.build_rag_chain(query_type)
+            if facts_response:
+                facts_document = Document(
+                    page_content=facts_response,
+                    metadata={"source": "facts_store", "type": "financial_facts"}
+                )
+                sources = [facts_document] + sources
             
-            # Get response
-            response = rag_chain.invoke({"query": question})
-            answer = response["result"]
-            sources = response["source_documents"]
+            # Generate under the chat model's guard, within the caller's deadline
+            deadline = None if deadline_at is None else deadline_at - time.monotonic()
+            response = self.llm_guard.call(
+                rag_chain.combine_documents_chain.invoke,
+                {"input_documents": sources, "question": question},
+                deadline=deadline
+            )
+            answer = response["output_text"]
             
             # Post-process answer for better formatting
             answer = self.post_process_answer(answer, query_type)
+            self.remember_answer(question, query_type, answer, sources)
             
             return answer, sources
             
+        except GeminiUnavailableError as e:
+            # The caller's own deadline is reported as such, not as a busy service
+            if deadline_at is not None and isinstance(e, DeadlineExceededError):
+                raise
+            print(f"Gemini unavailable: {e}")
+            return self.fallback_answer(question, query_type, e)
         except Exception as e:
             print(f"Error answering question: {e}")
             return f"An error occurred while processing your question: {str(e)}. Please try rephrasing your question.", []
+    
+    def is_stock_answer(self, stock_response):
+        """True if the structured stock lookup produced an answer we can return directly."""
+        return "Stock price data not available" not in stock_response and "No specific date range" not in stock_response
+    
+    def is_mixed_question(self, question):
+        """True if a stock question also asks about something only the documents can answer."""
+        question_lower = question.lower()
+        return any(re.search(rf'\b{word}\b', question_lower) for word in MIXED_QUESTION_WORDS)
+    
+    def is_fact_lookup(self, question):
+        """True if a metric question asks only for figures (a lookup or comparison), not a narrative."""
+        question_lower = question.lower()
+        if self.is_mixed_question(question):
+            return False
+        if any(re.search(rf'\b{word}\b', question_lower) for word in NARRATIVE_WORDS):
+            return False
+        # "BAGIC combined ratio" is a lookup even without a verb
+        if find_metrics(question) and find_entities(question):
+            return True
+        return bool(find_periods(question)) or any(
+            re.search(rf'\b{word}\b', question_lower) for word in FACT_LOOKUP_WORDS + COMPARISON_WORDS
+        )
+    
+    def relevance_threshold(self, query_type):
+        """Minimum relevance score of the best chunk for a query type, or None for no gating."""
+        thresholds = self.relevance_thresholds
+        return thresholds.get("thresholds", {}).get(query_type, thresholds.get("default"))
+    
+    def no_context_answer(self, query_type):
+        """Immediate reply when the documents hold nothing relevant to a question."""
+        example = EXAMPLE_QUESTIONS[NO_CONTEXT_EXAMPLES.get(query_type, "🔍 General Queries")][0]
+        return (
+            "I couldn't find anything relevant to this question in the Bajaj Finserv documents, "
+            "so I haven't guessed an answer. Try mentioning a specific business, metric or period "
+            f"covered by the documents, for example: \"{example}\""
+        )
+    
+    def retrieve_documents(self, rag_chain, question):
+        """
+        Retrieve context for a question, reusing recent results for the same
+        question (unless `retrieval_cache_size` is 0). Each document's
+        metadata gets its `relevance_score`.
+        """
+        vector_store = rag_chain.retriever.vectorstore
+        key = normalize_question(question)
+        with self._answer_cache_lock:
+            cached = self._retrieval_cache.get(key)
+            if cached is not None and cached[0] is vector_store and self.retrieval_cache_size:
+                self._retrieval_cache.move_to_end(key)
+                return cached[1]
+        
+        k = rag_chain.retriever.search_kwargs.get("k", 4)
+        sources = []
+        for doc, distance in vector_store.similarity_search_with_score(question, k=k):
+            doc.metadata["relevance_score"] = round(relevance_from_distance(distance), 4)
+            sources.append(doc)
+        if not self.retrieval_cache_size:
+            return sources
+        with self._answer_cache_lock:
+            self._retrieval_cache[key] = (vector_store, sources)
+            self._retrieval_cache.move_to_end(key)
+            while len(self._retrieval_cache) > self.retrieval_cache_size:
+                self._retrieval_cache.popitem(last=False)
+        return sources
+    
+    def remember_answer(self, question, query_type, answer, sources, computed_at=None, expires_at=None):
+        """
+        Cache a generated answer; also used to seed precomputed answers at
+        startup. An entry with `expires_at` is served until then regardless
+        of the cache TTL (every entry is dropped when the index is reloaded).
+        """
+        with self._answer_cache_lock:
+            key = (normalize_question(question), query_type)
+            self._answer_cache[key] = (answer, sources, computed_at or time.time(), expires_at)
+            self._answer_cache.move_to_end(key)
+            while len(self._answer_cache) > ANSWER_CACHE_SIZE:
+                self._answer_cache.popitem(last=False)
+    
+    def cached_answer(self, question, query_type, max_age=None):
+        """
+        Cached (answer, sources) for a question if younger than `max_age`
+        seconds (or, for seeded entries, not yet expired), else None.
+        """
+        with self._answer_cache_lock:
+            cached = self._answer_cache.get((normalize_question(question), query_type))
+        if cached is None:
+            return None
+        answer, sources, computed_at, expires_at = cached
+        if expires_at is not None and max_age is not None:
+            if time.time() > expires_at:
+                return None
+        elif max_age is not None and time.time() - computed_at > max_age:
+            return None
+        return answer, sources
+    
+    def log_query(self, question, query_type, elapsed, cached=False):
+        """Append a question to the query log (used to pick questions for cache warming)."""
+        if not self.query_log_path:
+            return
+        entry = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "question": question,
+            "query_type": query_type,
+            "elapsed": round(elapsed, 3),
+            "cached": cached
+        }
+        try:
+            with self._query_log_lock:
+                os.makedirs(os.path.dirname(self.query_log_path) or ".", exist_ok=True)
+                with open(self.query_log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Error writing query log: {e}")
+    
+    def fallback_answer(self, question, query_type, error):
+        """Answer without Gemini: a cached answer, reported figures, the stock fast path, or a retry hint."""
+        cached = self.cached_answer(question, query_type)
+        if cached:
+            answer, sources = cached
+            return "⚠️ The AI service is busy, showing a recent answer to this question.\n\n" + answer, sources
+        
+        facts_response, fact_documents = self.get_financial_facts(question)
+        if facts_response:
+            return "⚠️ The AI service is busy, showing the reported figures only.\n\n" + facts_response, fact_documents
+        
+        stock_response = self.get_stock_price_data(question)
+        if self.is_stock_answer(stock_response) and not stock_response.startswith(("No stock data", "No price data")):
+            return stock_response, []
+        
+        retry_after = f" in about {int(error.retry_after) + 1} seconds" if error.retry_after else " shortly"
+        return f"The AI service is temporarily busy. Please try again{retry_after}.", []
 
     def post_process_answer(self, answer, query_type):
         """Post-process the answer for better formatting and clarity."""
@@ -326,18 +866,18 @@ class EnhancedBajajChatbot:
         
         return answer
 
-def build_enhanced_rag_chain(vector_store, api_key, stock_data_path=None):
+def build_enhanced_rag_chain(vector_store, api_key, stock_data_path=None, stock_store=None, facts_store=None):
     """Factory function to create enhanced chatbot."""
-    return EnhancedBajajChatbot(vector_store, api_key, stock_data_path)
+    return EnhancedBajajChatbot(vector_store, api_key, stock_data_path, stock_store, facts_store=facts_store)
 
-def answer_question_enhanced(chatbot, question):
+def answer_question_enhanced(chatbot, question, profile=False):
     """Enhanced question answering function."""
-    return chatbot.answer_question(question)
+    return chatbot.answer_question(question, profile=profile)
 
 if __name__ == "__main__":
     # Test the enhanced chatbot
     from config import get_api_key
-    from enhanced_data_loader import get_or_create_vector_database_enhanced
+    from index_manager import get_or_create_current_index
     import os
 
     DATA_FOLDER = "data"
@@ -347,7 +887,7 @@ if __name__ == "__main__":
     api_key = get_api_key()
     if api_key:
         print("\n--- Testing Enhanced Chatbot ---")
-        vectordb = get_or_create_vector_database_enhanced(DATA_FOLDER, DB_FOLDER, api_key, force_rebuild=False)
+        vectordb = get_or_create_current_index(DATA_FOLDER, DB_FOLDER, api_key)
         
         if vectordb:
             chatbot = build_enhanced_rag_chain(vectordb, api_key, STOCK_DATA_PATH)
@@ -355,6 +895,7 @@ if __name__ == "__main__":
             test_questions = [
                 "What was the average stock price of Bajaj Finserv in 2022?",
                 "What was the highest stock price in 2023?",
+                "Compare Bajaj Finance vs Bajaj Finserv stock price in 2023",
                 "Why is BAGIC facing headwinds in motor insurance business?",
                 "Act as a CFO of BAGIC and help me draft commentary for upcoming investor call"
             ]
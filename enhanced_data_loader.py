@@ -5,9 +5,13 @@ import csv
 import pandas as pd
 from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain.schema import Document
+from gemini_client import get_embeddings
+from stock_store import (
+    DEFAULT_TICKER, split_by_ticker, display_name, normalize_price_columns, is_price_frame,
+    compact_frame, resample_prices
+)
 
 def load_documents_enhanced(folder_path):
     """
@@ -16,114 +20,229 @@ def load_documents_enhanced(folder_path):
     documents = []
     
     for filename in os.listdir(folder_path):
-        filepath = os.path.join(folder_path, filename)
-        
-        if filename.endswith(".pdf"):
-            try:
-                with open(filepath, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    text = ""
-                    for page_num, page in enumerate(reader.pages):
-                        page_text = page.extract_text() or ""
-                        if page_text.strip():
-                            # Add page number for better context
-                            text += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
-                    
-                    if text.strip():
-                        documents.append({
-                            "content": text,
-                            "source": filename,
-                            "type": "pdf"
-                        })
-                        print(f"✅ Loaded PDF: {filename} ({len(text)} characters)")
-            except Exception as e:
-                print(f"❌ Error loading PDF {filename}: {e}")
-                
-        elif filename.endswith(".csv"):
-            try:
-                # Enhanced CSV processing for stock data
-                df = pd.read_csv(filepath)
+        documents.extend(load_file_enhanced(os.path.join(folder_path, filename)))
+    
+    return documents
+
+def extract_pdf_pages(filepath):
+    """
+    Text of each non-empty PDF page as (page number, text), numbered from 1.
+    """
+    pages = []
+    with open(filepath, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        for page_num, page in enumerate(reader.pages):
+            page_text = page.extract_text() or ""
+            if page_text.strip():
+                pages.append((page_num + 1, page_text))
+    return pages
+
+def load_file_enhanced(filepath):
+    """
+    Load the documents for a single data file (PDF or CSV).
+    """
+    documents = []
+    filename = os.path.basename(filepath)
+    
+    if filename.endswith(".pdf"):
+        try:
+            text = ""
+            for page_num, page_text in extract_pdf_pages(filepath):
+                # Add page number for better context
+                text += f"\n--- Page {page_num} ---\n{page_text}\n"
+            
+            if text.strip():
+                documents.append({
+                    "content": text,
+                    "source": filename,
+                    "type": "pdf"
+                })
+                print(f"✅ Loaded PDF: {filename} ({len(text)} characters)")
+        except Exception as e:
+            print(f"❌ Error loading PDF {filename}: {e}")
+            
+    elif filename.endswith(".csv"):
+        try:
+            # Decide from the first rows whether this is stock price data
+            sample = normalize_price_columns(pd.read_csv(filepath, nrows=5))
+            
+            if is_price_frame(sample):
+                # Process as stock price data, one summary per ticker in the file;
+                # intraday bars are rolled up to daily bars first
+                price_df = normalize_price_columns(pd.read_csv(filepath))
+                for ticker, ticker_df in split_by_ticker(price_df, filename).items():
+                    daily_df = resample_prices(compact_frame(ticker_df), "D")
+                    documents.extend(process_stock_data(daily_df, filename, ticker))
+                print(f"✅ Loaded stock data CSV: {filename} ({len(price_df)} records)")
+            else:
+                # Process as general CSV, streamed in row blocks
+                csv_documents = load_csv_row_blocks(filepath)
+                documents.extend(csv_documents)
+                print(f"✅ Loaded CSV: {filename} ({len(csv_documents)} row blocks)")
                 
-                if 'Date' in df.columns and 'Close Price' in df.columns:
-                    # Process as stock price data
-                    stock_summary = process_stock_data(df, filename)
-                    documents.append({
-                        "content": stock_summary,
-                        "source": filename,
-                        "type": "stock_data"
-                    })
-                    print(f"✅ Loaded stock data CSV: {filename} ({len(df)} records)")
-                else:
-                    # Process as general CSV
-                    csv_content = df.to_string(index=False)
-                    documents.append({
-                        "content": csv_content,
-                        "source": filename,
-                        "type": "csv"
-                    })
-                    print(f"✅ Loaded CSV: {filename}")
-                    
-            except Exception as e:
-                print(f"❌ Error loading CSV {filename}: {e}")
+        except Exception as e:
+            print(f"❌ Error loading CSV {filename}: {e}")
     
     return documents
 
-def process_stock_data(df, filename):
+# Generic CSVs are read CSV_READ_ROWS rows at a time and emitted as blocks
+# of whole rows that fit in one chunk of split_documents_enhanced
+CSV_READ_ROWS = 5000
+CSV_BLOCK_CHARS = 1400
+
+def load_csv_row_blocks(filepath):
     """
-    Process stock price data into a more searchable format.
+    Load a generic CSV as documents of consecutive rows.
+    
+    The file is read in row chunks, so memory use does not grow with its
+    size. Each document holds the header plus as many whole rows (in CSV
+    form) as fit in CSV_BLOCK_CHARS, and records its 1-based row range in
+    the metadata.
+    """
+    filename = os.path.basename(filepath)
+    documents = []
+    
+    def add_block(header, rows, row_start):
+        row_end = row_start + len(rows) - 1
+        documents.append({
+            "content": f"{filename} rows {row_start}-{row_end}\n{header}" + "".join(rows),
+            "source": filename,
+            "type": "csv",
+            "metadata": {"row_start": row_start, "row_end": row_end}
+        })
+    
+    next_row = 1
+    for chunk in pd.read_csv(filepath, chunksize=CSV_READ_ROWS):
+        # One line per row: line breaks inside quoted cells become spaces
+        chunk = chunk.replace(r'[\r\n]+', ' ', regex=True)
+        header = chunk.head(0).to_csv(index=False, lineterminator="\n")
+        rows, size, row_start = [], len(header), next_row
+        for line in chunk.to_csv(index=False, header=False, lineterminator="\n").splitlines(keepends=True):
+            if rows and size + len(line) > CSV_BLOCK_CHARS:
+                add_block(header, rows, row_start)
+                row_start += len(rows)
+                rows, size = [], len(header)
+            rows.append(line)
+            size += len(line)
+        if rows:
+            add_block(header, rows, row_start)
+        next_row += len(chunk)
+    
+    return documents
+
+# Roll-up rules used to combine monthly price groups into quarters and years
+PERIOD_ROLLUP = {
+    'high': 'max',
+    'low': 'min',
+    'total': 'sum',
+    'days': 'sum',
+    'first': 'first',
+    'last': 'last',
+    'start': 'min',
+    'end': 'max',
+}
+
+def process_stock_data(df, filename, ticker=DEFAULT_TICKER):
+    """
+    Process stock price data into small per-period documents.
+
+    Closing prices are grouped by month in a single pass; quarters (Indian
+    fiscal, April-March) and calendar years are rolled up from the monthly
+    groups. Returns an overview document plus one document per year,
+    quarter and month, each carrying its period in the metadata.
     """
     # Convert date column
-    try:
-        df['Date'] = pd.to_datetime(df['Date'], format='%d-%b-%y')
-    except:
+    if not pd.api.types.is_datetime64_any_dtype(df['Date']):
         try:
-            df['Date'] = pd.to_datetime(df['Date'])
+            df['Date'] = pd.to_datetime(df['Date'], format='%d-%b-%y')
         except:
-            pass
-    
-    # Create summary statistics by year
-    yearly_stats = []
-    for year in df['Date'].dt.year.unique():
-        year_data = df[df['Date'].dt.year == year]
-        stats = {
-            'year': year,
-            'highest': year_data['Close Price'].max(),
-            'lowest': year_data['Close Price'].min(),
-            'average': year_data['Close Price'].mean(),
-            'records': len(year_data)
+            df['Date'] = pd.to_datetime(df['Date'])
+    
+    df = df.sort_values('Date')
+    company_name = display_name(ticker)
+    
+    monthly = df.groupby([df['Date'].dt.year.rename('year'), df['Date'].dt.month.rename('month')]).agg(
+        high=('Close Price', 'max'),
+        low=('Close Price', 'min'),
+        total=('Close Price', 'sum'),
+        days=('Close Price', 'count'),
+        first=('Close Price', 'first'),
+        last=('Close Price', 'last'),
+        start=('Date', 'min'),
+        end=('Date', 'max'),
+    ).reset_index()
+    monthly['fiscal_year'] = monthly['year'] + (monthly['month'] >= 4)
+    monthly['fiscal_quarter'] = (monthly['month'] - 4) % 12 // 3 + 1
+    
+    quarterly = monthly.groupby(['fiscal_year', 'fiscal_quarter']).agg(PERIOD_ROLLUP).reset_index()
+    yearly = monthly.groupby('year').agg(PERIOD_ROLLUP).reset_index()
+    
+    documents = []
+    
+    def add_document(period, label, row, extra_metadata):
+        content = f"{company_name} ({ticker}) Stock Price Summary for {label}\n"
+        content += format_period_stats(row)
+        metadata = {
+            "ticker": ticker,
+            "period": period,
+            "start_date": row['start'].strftime('%Y-%m-%d'),
+            "end_date": row['end'].strftime('%Y-%m-%d'),
         }
-        yearly_stats.append(stats)
-    
-    # Create searchable text
-    summary_text = f"Bajaj Finserv Stock Price Data from {filename}\n\n"
-    summary_text += "Yearly Statistics:\n"
-    
-    for stats in yearly_stats:
-        summary_text += f"Year {stats['year']}:\n"
-        summary_text += f"  - Highest Price: ₹{stats['highest']:.2f}\n"
-        summary_text += f"  - Lowest Price: ₹{stats['lowest']:.2f}\n"
-        summary_text += f"  - Average Price: ₹{stats['average']:.2f}\n"
-        summary_text += f"  - Trading Days: {stats['records']}\n\n"
-    
-    # Add monthly breakdown for recent years
-    recent_years = sorted(df['Date'].dt.year.unique())[-2:]  # Last 2 years
-    for year in recent_years:
-        year_data = df[df['Date'].dt.year == year]
-        monthly_stats = year_data.groupby(year_data['Date'].dt.month).agg({
-            'Close Price': ['max', 'min', 'mean']
-        }).round(2)
-        
-        summary_text += f"Monthly Breakdown for {year}:\n"
-        for month in monthly_stats.index:
-            month_name = pd.Timestamp(year=year, month=month, day=1).strftime('%B')
-            max_price = monthly_stats.loc[month, ('Close Price', 'max')]
-            min_price = monthly_stats.loc[month, ('Close Price', 'min')]
-            avg_price = monthly_stats.loc[month, ('Close Price', 'mean')]
-            
-            summary_text += f"  {month_name}: High ₹{max_price}, Low ₹{min_price}, Avg ₹{avg_price}\n"
-        summary_text += "\n"
+        metadata.update(extra_metadata)
+        documents.append({
+            "content": content,
+            "source": filename,
+            "type": "stock_data",
+            "metadata": metadata
+        })
     
-    return summary_text
+    # Overview of the whole history, one line per year
+    overview = f"{company_name} ({ticker}) Stock Price Data from {filename}\n\nYearly Statistics:\n"
+    for row in yearly.itertuples():
+        overview += (
+            f"Year {row.year}: High ₹{row.high:.2f}, Low ₹{row.low:.2f}, "
+            f"Avg ₹{row.total / row.days:.2f}, Trading Days {row.days}\n"
+        )
+    documents.append({
+        "content": overview,
+        "source": filename,
+        "type": "stock_data",
+        "metadata": {
+            "ticker": ticker,
+            "period": "overview",
+            "start_date": df['Date'].min().strftime('%Y-%m-%d'),
+            "end_date": df['Date'].max().strftime('%Y-%m-%d'),
+        }
+    })
+    
+    for _, row in yearly.iterrows():
+        add_document("year", f"Year {row['year']}", row, {"year": int(row['year'])})
+    
+    for _, row in quarterly.iterrows():
+        fiscal_year, fiscal_quarter = int(row['fiscal_year']), int(row['fiscal_quarter'])
+        label = (
+            f"Q{fiscal_quarter} FY{fiscal_year % 100:02d} "
+            f"({row['start'].strftime('%B %Y')} to {row['end'].strftime('%B %Y')})"
+        )
+        add_document("quarter", label, row, {"fiscal_year": fiscal_year, "fiscal_quarter": fiscal_quarter})
+    
+    for _, row in monthly.iterrows():
+        label = row['start'].strftime('%B %Y')
+        add_document("month", label, row, {"year": int(row['year']), "month": int(row['month'])})
+    
+    return documents
+
+def format_period_stats(row):
+    """Format the closing price statistics of one period."""
+    change = (row['last'] - row['first']) / row['first'] * 100 if row['first'] else 0.0
+    return (
+        f"Period: {row['start'].strftime('%Y-%m-%d')} to {row['end'].strftime('%Y-%m-%d')}\n"
+        f"  - Highest Price: ₹{row['high']:.2f}\n"
+        f"  - Lowest Price: ₹{row['low']:.2f}\n"
+        f"  - Average Price: ₹{row['total'] / row['days']:.2f}\n"
+        f"  - First Close: ₹{row['first']:.2f}, Last Close: ₹{row['last']:.2f} ({change:+.2f}%)\n"
+        f"  - Trading Days: {int(row['days'])}\n"
+    )
 
 def split_documents_enhanced(documents):
     """
@@ -148,6 +267,7 @@ def split_documents_enhanced(documents):
                 "chunk_id": j + 1,
                 "total_chunks": len(chunks)
             }
+            metadata.update(doc.get("metadata", {}))
             
             all_chunks.append({
                 "page_content": chunk,
@@ -164,10 +284,7 @@ def create_vector_database_enhanced(chunks, db_path, api_key):
     print("🔄 Creating enhanced vector database...")
     
     try:
-        embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001", 
-            google_api_key=api_key
-        )
+        embeddings = get_embeddings(api_key)
 
         # Convert chunks to LangChain Document objects
         langchain_documents = [
@@ -195,10 +312,7 @@ def load_vector_database_enhanced(db_path, api_key):
     print("🔄 Loading enhanced vector database...")
     
     try:
-        embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001", 
-            google_api_key=api_key
-        )
+        embeddings = get_embeddings(api_key)
         vectordb = Chroma(persist_directory=db_path, embedding_function=embeddings)
         print(f"✅ Enhanced vector database loaded from {db_path}")
         return vectordb
@@ -230,6 +344,7 @@ def get_or_create_vector_database_enhanced(data_folder, db_path, api_key, force_
 if __name__ == "__main__":
     # Test the enhanced data loader
     from config import get_api_key
+    from index_manager import build_staged_index
     import os
 
     DATA_FOLDER = "data"
@@ -239,9 +354,8 @@ if __name__ == "__main__":
     api_key = get_api_key()
     if api_key:
         print("\n--- Testing Enhanced Data Loader ---")
-        vectordb = get_or_create_vector_database_enhanced(
-            DATA_FOLDER, DB_FOLDER, api_key, force_rebuild=True
-        )
+        # Build, validate and publish a new index version
+        vectordb = build_staged_index(DATA_FOLDER, DB_FOLDER, api_key)
         
         if vectordb:
             print("✅ Enhanced data loader test successful!")
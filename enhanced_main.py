@@ -1,15 +1,22 @@
 # enhanced_main.py
 import os
+import argparse
 from config import get_api_key
-from enhanced_data_loader import get_or_create_vector_database_enhanced
-from enhanced_chatbot_logic import build_enhanced_rag_chain, answer_question_enhanced
+from index_manager import get_or_create_current_index, current_version, IndexReloader
+from enhanced_chatbot_logic import build_enhanced_rag_chain, answer_question_enhanced, EXAMPLE_QUESTIONS
+from stock_store import StockStore
+from facts_store import FactsStore
+from data_watcher import DataFolderWatcher
+from profiling import PROFILE_DIR, profile_run
+from cache_warmer import QUERY_LOG_PATH, TOP_N_LOGGED, build_warmup_questions, load_precomputed, start_cache_warming
 
 # --- Configuration ---
 DATA_FOLDER = "data"
 DB_FOLDER = "chroma_db"
-STOCK_DATA_PATH = os.path.join(DATA_FOLDER, "BFS_Share_Price.csv")
+STOCK_STORE_FOLDER = "stock_store"
+FACTS_STORE_FOLDER = "facts_store"
 
-def main():
+def main(profile=False, profile_dir=PROFILE_DIR, warmup=True, warmup_top_n=TOP_N_LOGGED):
     print("🚀 Starting Enhanced Bajaj Finserv RAG Chatbot...")
     print("=" * 60)
 
@@ -25,41 +32,58 @@ def main():
         print("Please set GOOGLE_API_KEY in your .env file.")
         return
 
-    # 2. Data Loading & Vector Database Creation/Loading
-    force_rebuild_db = False
-    if not os.path.exists(DB_FOLDER) or not os.listdir(DB_FOLDER):
-        print("📁 ChromaDB folder not found or empty. Forcing initial build.")
-        force_rebuild_db = True
-
-    print("🔄 Initializing enhanced vector database...")
-    vector_store = get_or_create_vector_database_enhanced(
-        DATA_FOLDER,
-        DB_FOLDER,
-        api_key,
-        force_rebuild=force_rebuild_db
-    )
-
-    if vector_store is None:
-        print("❌ Failed to initialize vector database. Exiting.")
-        return
+    with profile_run("startup", profile_dir, enabled=profile):
+        # 2. Data Loading & Vector Database Creation/Loading
+        # (builds and publishes the first index version if none exists yet)
+        print("🔄 Initializing enhanced vector database...")
+        vector_store = get_or_create_current_index(DATA_FOLDER, DB_FOLDER, api_key)
+
+        if vector_store is None:
+            print("❌ Failed to initialize vector database. Exiting.")
+            return
+
+        # 3. Stock Price Store (partitions are loaded per ticker on first query)
+        print("🔄 Indexing stock price files...")
+        stock_store = StockStore(STOCK_STORE_FOLDER)
+        stock_store.ingest_folder(DATA_FOLDER)
+
+        # Reported figures from the PDFs (only new or changed files are extracted)
+        print("🔄 Extracting financial facts from reports...")
+        facts_store = FactsStore(FACTS_STORE_FOLDER)
+        facts_store.ingest_folder(DATA_FOLDER)
 
-    # 3. Build Enhanced Chatbot
+    # 4. Build Enhanced Chatbot
     print("🤖 Building enhanced chatbot...")
-    chatbot = build_enhanced_rag_chain(vector_store, api_key, STOCK_DATA_PATH)
+    chatbot = build_enhanced_rag_chain(vector_store, api_key, stock_store=stock_store, facts_store=facts_store)
+    chatbot.profile_dir = profile_dir
+    chatbot.profile_all = profile
+    chatbot.query_log_path = QUERY_LOG_PATH
+
+    # Serve last night's precomputed answers, then warm the rest in the background
+    load_precomputed(chatbot, index_version=current_version(DB_FOLDER))
+    if warmup:
+        start_cache_warming(chatbot, build_warmup_questions(QUERY_LOG_PATH, warmup_top_n))
+
+    # Pick up new or changed data files in the background
+    DataFolderWatcher(DATA_FOLDER, chatbot, DB_FOLDER, api_key).start()
+    # Switch to new index versions published by rebuild_database.py
+    IndexReloader(DB_FOLDER, chatbot, api_key).start()
 
     print("\n" + "=" * 60)
     print("🎯 Enhanced Chatbot is ready!")
     print("💡 Example questions you can ask:")
     print("   • What was the highest stock price of Bajaj Finserv in 2022?")
     print("   • Compare Bajaj Finserv performance from 2022 to 2023")
+    print("   • Bajaj Finance vs Bajaj Finserv stock price in 2023")
     print("   • Why is BAGIC facing headwinds in motor insurance business?")
     print("   • What's the rationale of Hero partnership?")
     print("   • Act as a CFO of BAGIC and help me draft commentary")
     print("   • Give me table with dates explaining Allianz stake sale discussions")
     print("=" * 60)
     print("Type 'exit' to quit or 'help' for more examples.")
+    print("Prefix a question with 'profile ' to write a profiling report for it.")
 
-    # 4. Enhanced Question Answering Loop
+    # 5. Enhanced Question Answering Loop
     while True:
         try:
             user_question = input("\n🤔 Your Question: ").strip()
@@ -76,8 +100,12 @@ def main():
                 print("⚠️  Please enter a question.")
                 continue
 
+            profile_question = user_question.lower().startswith('profile ')
+            if profile_question:
+                user_question = user_question[len('profile '):].strip()
+
             print("🔄 Processing your question...")
-            answer, sources = answer_question_enhanced(chatbot, user_question)
+            answer, sources = answer_question_enhanced(chatbot, user_question, profile=profile_question)
 
             print("\n" + "📝" + "=" * 50)
             print("💬 ANSWER:")
@@ -108,32 +136,7 @@ def print_help_examples():
     print("💡 EXAMPLE QUESTIONS BY CATEGORY:")
     print("=" * 60)
     
-    examples = {
-        "📈 Stock Price Queries": [
-            "What was the highest stock price of Bajaj Finserv in 2022?",
-            "What was the average stock price in 2023?",
-            "What was the lowest stock price in January 2022?",
-            "Compare stock prices from 2022 to 2023"
-        ],
-        "💼 Business Insights": [
-            "Why is BAGIC facing headwinds in motor insurance business?",
-            "What's the rationale of Hero partnership?",
-            "Tell me about organic traffic of Bajaj Markets",
-            "What are the discussions regarding Allianz stake sale?"
-        ],
-        "📊 Financial Analysis": [
-            "Act as a CFO of BAGIC and help me draft commentary for upcoming investor call",
-            "What are the key financial highlights from Q4 FY25?",
-            "Compare Bajaj Finserv performance from Q1 to Q4 FY25"
-        ],
-        "🔍 General Queries": [
-            "What products does Bajaj Finserv offer?",
-            "What are the key strategic initiatives?",
-            "How is the company performing in different business segments?"
-        ]
-    }
-    
-    for category, questions in examples.items():
+    for category, questions in EXAMPLE_QUESTIONS.items():
         print(f"\n{category}:")
         for i, question in enumerate(questions, 1):
             print(f"  {i}. {question}")
@@ -141,4 +144,10 @@ def print_help_examples():
     print("\n" + "=" * 60)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Enhanced Bajaj Finserv RAG Chatbot")
+    parser.add_argument("--profile", action="store_true", help="write cProfile/tracemalloc reports for startup and every question")
+    parser.add_argument("--profile-dir", default=PROFILE_DIR, help=f"directory for profiling reports (default: {PROFILE_DIR})")
+    parser.add_argument("--no-warmup", action="store_true", help="skip warming the answer cache at startup")
+    parser.add_argument("--warmup-top-n", type=int, default=TOP_N_LOGGED, help=f"top logged questions to warm (default: {TOP_N_LOGGED})")
+    args = parser.parse_args()
+    main(profile=args.profile, profile_dir=args.profile_dir, warmup=not args.no_warmup, warmup_top_n=args.warmup_top_n) 
\ No newline at end of file
@@ -0,0 +1,400 @@
+# facts_store.py
+import os
+import re
+import sqlite3
+import threading
+from contextlib import closing
+from enhanced_data_loader import extract_pdf_pages
+
+FACTS_DB_FILE = "facts.db"
+# Bump when extraction changes so existing files are re-extracted
+EXTRACTION_LAYOUT = 1
+DEFAULT_ENTITY = "Bajaj Finserv"
+
+# Canonical metric -> (kind, aliases). Amounts are stored in ₹ crore, ratios
+# in percent and counts in millions.
+METRICS = {
+    "Gross written premium": ("amount", ["gross written premium", "gwp", "gross direct premium"]),
+    "New business premium": ("amount", ["new business premium", "nbp"]),
+    "Profit after tax": ("amount", ["profit after tax", "pat", "net profit"]),
+    "Profit before tax": ("amount", ["profit before tax", "pbt"]),
+    "Total income": ("amount", ["total income", "total revenue", "revenue"]),
+    "Assets under management": ("amount", ["assets under management", "aum"]),
+    "Disbursements": ("amount", ["disbursements", "disbursement"]),
+    "Value of new business": ("amount", ["value of new business", "vnb"]),
+    "Embedded value": ("amount", ["embedded value"]),
+    "Combined ratio": ("ratio", ["combined ratio"]),
+    "Loss ratio": ("ratio", ["loss ratio", "claims ratio"]),
+    "Solvency ratio": ("ratio", ["solvency ratio", "solvency margin"]),
+    "Return on equity": ("ratio", ["return on equity", "roe"]),
+    "Gross NPA": ("ratio", ["gross npa", "gnpa", "gross non-performing assets"]),
+    "Net NPA": ("ratio", ["net npa", "nnpa", "net non-performing assets"]),
+    "Net interest margin": ("ratio", ["net interest margin", "nim"]),
+    "VNB margin": ("ratio", ["vnb margin", "new business margin"]),
+    "Customer franchise": ("count", ["customer franchise"]),
+}
+
+ENTITIES = {
+    "Bajaj Finserv": ["bajaj finserv", "bfs", "consolidated"],
+    "Bajaj Finance": ["bajaj finance", "bfl"],
+    "BAGIC": ["bagic", "bajaj allianz general", "general insurance"],
+    "BALIC": ["balic", "bajaj allianz life", "life insurance"],
+    "Bajaj Housing Finance": ["bajaj housing finance", "bhfl"],
+    "Bajaj Markets": ["bajaj markets"],
+    "Bajaj Finserv Health": ["bajaj finserv health", "bfhl"],
+}
+
+# Money units -> factor to ₹ crore; count units -> factor to millions
+AMOUNT_UNITS = {"crore": 1, "crores": 1, "cr": 1, "lakh": 0.01, "lakhs": 0.01,
+                "bn": 100, "billion": 100, "mn": 0.1, "million": 0.1}
+COUNT_UNITS = {"mn": 1, "million": 1, "crore": 10, "crores": 10, "cr": 10, "lakh": 0.1, "lakhs": 0.1}
+
+PERIOD_PATTERN = re.compile(r"\b(?:(Q[1-4]|H[12]|9M)\s*)?FY\s*'?(?:20)?(\d{2})(?:\s*-\s*(\d{2}))?\b", re.IGNORECASE)
+# Calendar dates in questions: "March 2024", "31 Mar'24", "Mar 31, 2024", "in 2023", "CY2023".
+# A bare number only counts as a year after a preposition or "CY", so "PAT crossed 2000 crore" has no date.
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+MONTH_PATTERN = re.compile(
+    r"\b(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|"
+    r"oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?(?:\s+\d{1,2}(?:st|nd|rd|th)?,?)?\s*(?:'(\d{2})|((?:19|20)\d{2}))\b",
+    re.IGNORECASE
+)
+CALENDAR_YEAR_PATTERN = re.compile(r"\b(?:(CY)\s*'?|(?:in|for|during|of|since|year)\s+)((?:19|20)\d{2})\b(?!\s*[-/])", re.IGNORECASE)
+# "2023-24" names the fiscal year ending in 2024
+YEAR_RANGE_PATTERN = re.compile(r"\b((?:19|20)\d{2})\s*[-/]\s*(\d{2})\b")
+# Date-like words that no pattern above resolves to a fiscal period
+UNRESOLVED_DATE_PATTERN = re.compile(
+    r"\b(?:january|february|march|april|june|july|august|september|october|november|december|"
+    r"(?:19|20)\d{2}(?!\s*(?:crores?|cr|lakhs?|bn|billion|mn|million|%|bps)\b)|"
+    r"(?:last|this|next|previous|current)\s+(?:year|quarter|month)|yesterday|today)\b",
+    re.IGNORECASE
+)
+VALUE_PATTERN = re.compile(
+    r"(?<![\w.])(₹|rs\.?|inr)?\s*(-?\d[\d,]*(?:\.\d+)?)\s*"
+    r"(%|per\s*cent|crores?\b|cr\b|lakhs?\b|bn\b|billion\b|mn\b|million\b|bps\b)?",
+    re.IGNORECASE
+)
+TABLE_UNIT_PATTERN = re.compile(r"(?:₹|rs\.?|inr)\s*(?:in\s*)?(crores?|cr|lakhs?|bn|billion|mn|million)\b", re.IGNORECASE)
+SENTENCE_PATTERN = re.compile(r"(?<=[.;!?])\s+(?=[A-Z₹])")
+# How far after a metric name a value may appear in running text
+VALUE_WINDOW = 120
+
+
+def _alias_pattern(aliases):
+    alternatives = "|".join(re.escape(a) for a in sorted(aliases, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternatives})\b", re.IGNORECASE)
+
+
+_METRIC_PATTERNS = [(name, _alias_pattern(aliases)) for name, (_, aliases) in METRICS.items()]
+_ENTITY_PATTERNS = [(name, _alias_pattern(aliases)) for name, aliases in ENTITIES.items()]
+
+
+def _find_mentions(text, patterns):
+    """Non-overlapping (start, end, name) mentions, preferring the longest match."""
+    matches = sorted(
+        ((m.start(), m.end(), name) for name, pattern in patterns for m in pattern.finditer(text)),
+        key=lambda m: (m[0], -(m[1] - m[0]))
+    )
+    mentions = []
+    for start, end, name in matches:
+        if not mentions or start >= mentions[-1][1]:
+            mentions.append((start, end, name))
+    return mentions
+
+
+def find_metrics(text):
+    """Canonical metrics mentioned in a text, in order of first mention."""
+    return list(dict.fromkeys(name for _, _, name in _find_mentions(text, _METRIC_PATTERNS)))
+
+
+def find_entities(text):
+    """Canonical entities mentioned in a text, in order of first mention."""
+    return list(dict.fromkeys(name for _, _, name in _find_mentions(text, _ENTITY_PATTERNS)))
+
+
+def parse_period(match):
+    """(label, fiscal_year, fiscal_quarter) for a PERIOD_PATTERN match, e.g. ('Q4 FY25', 2025, 4)."""
+    prefix, year, end_year = match.group(1), match.group(2), match.group(3)
+    yy = int(end_year or year)
+    label = f"{prefix.upper()} FY{yy:02d}" if prefix else f"FY{yy:02d}"
+    quarter = int(prefix[1]) if prefix and prefix.upper().startswith("Q") else None
+    return label, 2000 + yy, quarter
+
+
+def fiscal_quarter_of(year, month):
+    """(fiscal_year, fiscal_quarter) of a calendar month; the fiscal year runs April to March."""
+    return (year + 1 if month >= 4 else year), (month - 4) % 12 // 3 + 1
+
+
+def parse_calendar_period(match):
+    """Fiscal periods for a MONTH_PATTERN, CALENDAR_YEAR_PATTERN or YEAR_RANGE_PATTERN match."""
+    if match.re is YEAR_RANGE_PATTERN:
+        fiscal_year = int(match.group(1)) // 100 * 100 + int(match.group(2))
+        return [(f"FY{fiscal_year % 100:02d}", fiscal_year, None)]
+    if match.re is MONTH_PATTERN:
+        year = int(match.group(3)) if match.group(3) else 2000 + int(match.group(2))
+        fiscal_year, quarter = fiscal_quarter_of(year, MONTHS.index(match.group(1)[:3].lower()) + 1)
+        return [(f"Q{quarter} FY{fiscal_year % 100:02d}", fiscal_year, quarter)]
+    year = int(match.group(2))
+    if match.group(1):
+        # CY2023 is January-December: Q4 FY23 and Q1-Q3 FY24
+        return [(f"Q{q} FY{fy % 100:02d}", fy, q) for fy, q in ((year, 4), (year + 1, 1), (year + 1, 2), (year + 1, 3))]
+    # "in 2023" means the fiscal year ending in 2023, as in the reports' own usage
+    return [(f"FY{year % 100:02d}", year, None)]
+
+
+def _period_matches(text):
+    """Non-overlapping (start, end, periods) for every fiscal or calendar period mention, in order."""
+    matches = [(m.start(), m.end(), [parse_period(m)]) for m in PERIOD_PATTERN.finditer(text)]
+    for pattern in (MONTH_PATTERN, CALENDAR_YEAR_PATTERN, YEAR_RANGE_PATTERN):
+        matches += [(m.start(), m.end(), parse_calendar_period(m)) for m in pattern.finditer(text)]
+    mentions = []
+    for start, end, periods in sorted(matches, key=lambda m: (m[0], -m[1])):
+        if not mentions or start >= mentions[-1][1]:
+            mentions.append((start, end, periods))
+    return mentions
+
+
+def find_periods(text):
+    """
+    Fiscal periods mentioned in a text as (label, fiscal_year, fiscal_quarter),
+    in order. Calendar months and years are mapped to fiscal periods.
+    """
+    return list(dict.fromkeys(period for _, _, periods in _period_matches(text) for period in periods))
+
+
+def has_unresolved_date(text):
+    """True if a text mentions a date find_periods cannot map to a fiscal period."""
+    for start, end, _ in reversed(_period_matches(text)):
+        text = text[:start] + " " + text[end:]
+    return bool(UNRESOLVED_DATE_PATTERN.search(text))
+
+
+def parse_value(match, kind, table_unit=None):
+    """(value, unit) in the metric's canonical unit, or None if the number does not fit the kind."""
+    currency, number, unit = match.group(1), match.group(2), (match.group(3) or "").lower()
+    try:
+        value = float(number.replace(",", ""))
+    except ValueError:
+        return None
+    unit = re.sub(r"\s+", "", unit)
+    if kind == "ratio":
+        return (value, "%") if unit in ("%", "percent") else None
+    if kind == "count":
+        unit = unit or table_unit
+        return (value * COUNT_UNITS[unit], "mn") if unit in COUNT_UNITS else None
+    if unit in ("%", "percent", "bps"):
+        return None
+    unit = unit or table_unit
+    if unit in AMOUNT_UNITS:
+        return value * AMOUNT_UNITS[unit], "crore"
+    return (value, "INR") if currency else None
+
+
+def format_fact_value(value, unit):
+    if unit == "%":
+        return f"{value:.2f}%".replace(".00%", "%")
+    if unit == "crore":
+        return f"₹{value:,.0f} crore" if abs(value) >= 100 else f"₹{value:,.2f} crore"
+    if unit == "mn":
+        return f"{value:,.2f} million"
+    if unit == "INR":
+        return f"₹{value:,.2f}"
+    return f"{value:,.2f}"
+
+
+def default_period(filename, pages):
+    """Reporting period of a document: from its file name, else the first period on its first page."""
+    periods = find_periods(filename.replace("_", " "))
+    if not periods and pages:
+        periods = find_periods(pages[0][1])
+    return periods[0] if periods else None
+
+
+def extract_facts(filename, pages):
+    """
+    Extract metric facts from the text of a report or transcript.
+
+    Two passes per page: table rows (a line starting with a metric name under
+    a header line naming two or more periods, values taken in header order)
+    and running text (the first suitable value within VALUE_WINDOW characters
+    after a metric name in the same sentence). The entity is the last one
+    mentioned before the value, carried across lines and sentences; the
+    period is the one named in the sentence, else the document's period.
+    """
+    facts = []
+    doc_period = default_period(filename, pages)
+    doc_entities = find_entities(filename.replace("_", " "))
+    entity = doc_entities[0] if doc_entities else DEFAULT_ENTITY
+
+    def add(page, metric, period, value, unit, origin, snippet):
+        facts.append({
+            "source": filename, "page": page, "entity": current_entity, "metric": metric,
+            "period": period[0], "fiscal_year": period[1], "fiscal_quarter": period[2],
+            "value": value, "unit": unit, "origin": origin, "snippet": snippet.strip()[:300],
+        })
+
+    for page, text in pages:
+        # Tables
+        current_entity = entity
+        header_periods, table_unit = [], None
+        prose_lines = []
+        for line in text.splitlines():
+            entities = find_entities(line)
+            if entities:
+                current_entity = entities[-1]
+            periods = find_periods(line)
+            unit_match = TABLE_UNIT_PATTERN.search(line)
+            if unit_match:
+                table_unit = unit_match.group(1).lower()
+            metrics = _find_mentions(line, _METRIC_PATTERNS)
+            if len(periods) >= 2 and not metrics:
+                header_periods = periods
+                continue
+            if not header_periods or not metrics or metrics[0][0] > 3:
+                prose_lines.append(line)
+                continue
+            start, end, metric = metrics[0]
+            kind = METRICS[metric][0]
+            values = [parse_value(m, kind, table_unit) for m in VALUE_PATTERN.finditer(line[end:])]
+            values = [v for v in values if v is not None]
+            for period, (value, unit) in zip(header_periods, values):
+                add(page, metric, period, value, unit, "table", line)
+
+        # Running text
+        current_entity = entity
+        flat = re.sub(r"\s+", " ", "\n".join(prose_lines))
+        for sentence in SENTENCE_PATTERN.split(flat):
+            sentence_periods = find_periods(sentence)
+            period = sentence_periods[0] if sentence_periods else doc_period
+            entity_mentions = _find_mentions(sentence, _ENTITY_PATTERNS)
+            for start, end, metric in _find_mentions(sentence, _METRIC_PATTERNS):
+                before = [name for s, _, name in entity_mentions if s < start]
+                if before:
+                    current_entity = before[-1]
+                elif entity_mentions:
+                    current_entity = entity_mentions[0][2]
+                if period is None:
+                    continue
+                kind = METRICS[metric][0]
+                for match in VALUE_PATTERN.finditer(sentence[end:end + VALUE_WINDOW]):
+                    parsed = parse_value(match, kind)
+                    if parsed:
+                        add(page, metric, period, parsed[0], parsed[1], "text", sentence)
+                        break
+            if entity_mentions:
+                current_entity = entity_mentions[-1][2]
+    return facts
+
+
+class FactsStore:
+    """
+    Indexed SQLite store of financial facts (metric, value, period, entity)
+    extracted from PDF reports and transcripts at ingestion.
+
+    Files are re-extracted only when their modification time changes. A
+    connection is opened per operation, so one store can be shared by
+    threads and used from forked worker processes.
+    """
+
+    def __init__(self, root_dir="facts_store"):
+        self.root_dir = root_dir
+        self.db_path = os.path.join(root_dir, FACTS_DB_FILE)
+        self._lock = threading.RLock()
+        os.makedirs(root_dir, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS facts (
+                    id INTEGER PRIMARY KEY,
+                    source TEXT, page INTEGER, entity TEXT, metric TEXT,
+                    period TEXT, fiscal_year INTEGER, fiscal_quarter INTEGER,
+                    value REAL, unit TEXT, origin TEXT, snippet TEXT
+                );
+                CREATE INDEX IF NOT EXISTS facts_lookup ON facts (metric, entity, fiscal_year, fiscal_quarter);
+                CREATE INDEX IF NOT EXISTS facts_period ON facts (period);
+                CREATE INDEX IF NOT EXISTS facts_source ON facts (source);
+                CREATE TABLE IF NOT EXISTS sources (source TEXT PRIMARY KEY, mtime REAL, layout INTEGER);
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def ingest_folder(self, folder_path, force=False):
+        """Extract facts from every PDF in a folder. Returns the number of facts stored."""
+        total = 0
+        if not os.path.isdir(folder_path):
+            return total
+        for filename in sorted(os.listdir(folder_path)):
+            if filename.endswith(".pdf"):
+                total += self.ingest_file(os.path.join(folder_path, filename), force=force)
+        return total
+
+    def ingest_file(self, filepath, force=False):
+        """Extract and store the facts of one PDF, replacing earlier ones. Returns the number stored."""
+        filename = os.path.basename(filepath)
+        mtime = os.path.getmtime(filepath)
+        with self._lock:
+            with closing(self._connect()) as conn:
+                row = conn.execute("SELECT mtime, layout FROM sources WHERE source = ?", (filename,)).fetchone()
+            if row and not force and row["mtime"] == mtime and row["layout"] == EXTRACTION_LAYOUT:
+                return 0
+
+            try:
+                facts = extract_facts(filename, extract_pdf_pages(filepath))
+            except Exception as e:
+                print(f"❌ Error extracting facts from {filename}: {e}")
+                return 0
+
+            with closing(self._connect()) as conn, conn:
+                conn.execute("DELETE FROM facts WHERE source = ?", (filename,))
+                conn.executemany(
+                    "INSERT INTO facts (source, page, entity, metric, period, fiscal_year, fiscal_quarter,"
+                    " value, unit, origin, snippet) VALUES (:source, :page, :entity, :metric, :period,"
+                    " :fiscal_year, :fiscal_quarter, :value, :unit, :origin, :snippet)",
+                    facts
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO sources (source, mtime, layout) VALUES (?, ?, ?)",
+                    (filename, mtime, EXTRACTION_LAYOUT)
+                )
+        print(f"🔢 Extracted {len(facts)} financial facts from {filename}")
+        return len(facts)
+
+    def remove_file(self, filepath):
+        """Forget the facts of a deleted file. Returns the number removed."""
+        filename = os.path.basename(filepath)
+        with self._lock, closing(self._connect()) as conn, conn:
+            removed = conn.execute("DELETE FROM facts WHERE source = ?", (filename,)).rowcount
+            conn.execute("DELETE FROM sources WHERE source = ?", (filename,))
+        return removed
+
+    def count(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM facts").fetchone()[0]
+
+    def lookup(self, metrics=None, entities=None, periods=None, fiscal_years=None):
+        """
+        Facts matching every given filter, one per (entity, metric, period),
+        oldest period first. Table values win over values from running text.
+        """
+        clauses, params = [], []
+        for column, values in (("metric", metrics), ("entity", entities), ("period", periods), ("fiscal_year", fiscal_years)):
+            if values:
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        query = (
+            f"SELECT * FROM facts {where} "
+            "ORDER BY entity, metric, fiscal_year, COALESCE(fiscal_quarter, 5), origin = 'text', id"
+        )
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        facts, seen = [], set()
+        for row in rows:
+            key = (row["entity"], row["metric"], row["period"])
+            if key not in seen:
+                seen.add(key)
+                facts.append(dict(row))
+        return facts
@@ -0,0 +1,465 @@
+# gemini_client.py
+import os
+import time
+import random
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import google.generativeai as genai
+from google.generativeai.client import get_default_generative_client
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessageChunk, ChatMessageChunk, HumanMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from langchain_google_genai._common import GoogleGenerativeAIError
+from langchain_google_genai.chat_models import _response_to_result
+
+CHAT_MODEL = "gemini-2.0-flash"
+EMBEDDING_MODEL = "models/embedding-001"
+
+# Per-model quota and resilience settings; `configure_model` can override them
+MODEL_LIMITS = {
+    CHAT_MODEL: {
+        "requests_per_minute": 15,
+        "max_concurrency": 4,
+        "request_timeout": 30.0,
+        "deadline": 60.0,
+    },
+    EMBEDDING_MODEL: {
+        "requests_per_minute": 1500,
+        "max_concurrency": 8,
+        "request_timeout": 20.0,
+        "deadline": 120.0,
+    },
+}
+
+DEFAULT_LIMITS = {
+    "requests_per_minute": 60,
+    "max_concurrency": 4,
+    "request_timeout": 30.0,
+    "deadline": 60.0,
+    "max_retries": 5,
+    "base_delay": 1.0,
+    "max_delay": 20.0,
+    "failure_threshold": 5,
+    "reset_timeout": 30.0,
+    # Extra wait past the SDK's own request timeout before a call is given up as stalled
+    "timeout_grace": 5.0,
+}
+
+# Error fragments that mark a call as worth retrying (quota, overload, timeouts)
+TRANSIENT_MARKERS = [
+    "429", "resource exhausted", "resourceexhausted", "quota", "rate limit",
+    "500", "502", "503", "504", "unavailable", "deadline", "timeout", "timed out",
+    "internal error", "connection",
+]
+
+
+class GeminiUnavailableError(Exception):
+    """Raised when a Gemini call cannot be served (circuit open, quota or deadline exhausted)."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LocalBackpressureError(GeminiUnavailableError):
+    """
+    Raised when a call could not get a local rate-limit token or concurrency
+    slot before its deadline. Gemini was never called, so this is not a
+    service failure and is not recorded on the circuit breaker.
+    """
+
+
+class DeadlineExceededError(GeminiUnavailableError):
+    """
+    Raised when the caller's deadline ends while a call is still running
+    within its normal request timeout. Only calls that exceed the full
+    request timeout count as failures on the circuit breaker.
+    """
+
+
+class StalledCallError(GeminiUnavailableError):
+    """
+    Raised when a call has not returned well past its own SDK request
+    timeout. The call cannot be cancelled and may still be running, so it
+    is recorded as a failure but not retried.
+    """
+
+
+def is_transient_error(error):
+    """True for errors that a retry may fix (429s, 5xx, timeouts, dropped connections)."""
+    if isinstance(error, (TimeoutError, FutureTimeoutError, ConnectionError)):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in TRANSIENT_MARKERS)
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate_per_minute` tokens refilled continuously, up to `burst`."""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, rate_per_minute // 10)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take one token, waiting up to `timeout` seconds. Returns False if none became available."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def wait_time(self):
+        """Seconds until the next token is available."""
+        with self._lock:
+            tokens = min(self.capacity, self.tokens + (time.monotonic() - self.updated) * self.rate)
+            return max(0.0, (1 - tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through (half-open).
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def retry_after(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """Give back a half-open trial that never reached the service."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+class ModelGuard:
+    """
+    Wraps every call to one Gemini model with a token-bucket rate limiter, a
+    concurrency cap, per-attempt timeouts inside an overall deadline, jittered
+    exponential backoff on transient errors and a circuit breaker.
+    """
+
+    def __init__(self, model, **limits):
+        settings = dict(DEFAULT_LIMITS)
+        settings.update(MODEL_LIMITS.get(model, {}))
+        settings.update(limits)
+
+        self.model = model
+        self.settings = settings
+        self.limiter = TokenBucket(settings["requests_per_minute"])
+        self.semaphore = threading.BoundedSemaphore(settings["max_concurrency"])
+        self.breaker = CircuitBreaker(settings["failure_threshold"], settings["reset_timeout"])
+        self.in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings["max_concurrency"],
+            thread_name_prefix=f"gemini-{model.split('/')[-1]}"
+        )
+
+    def call(self, fn, *args, deadline=None, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` under the guard; raises GeminiUnavailableError
+        on give-up. `deadline` (seconds) overrides the model's own deadline.
+        """
+        settings = self.settings
+        give_up_at = time.monotonic() + (settings["deadline"] if deadline is None else max(0.0, deadline))
+        attempt = 0
+
+        while True:
+            if not self.breaker.allow():
+                raise GeminiUnavailableError(
+                    f"{self.model} is temporarily unavailable (circuit open)",
+                    retry_after=self.breaker.retry_after()
+                )
+
+            try:
+                result = self._attempt(fn, args, kwargs, give_up_at)
+            except (LocalBackpressureError, DeadlineExceededError):
+                # Our own quota, concurrency cap or deadline, not a Gemini failure
+                self.breaker.release_trial()
+                raise
+            except StalledCallError as e:
+                self.breaker.record_failure()
+                e.retry_after = self.breaker.retry_after()
+                raise
+            except Exception as e:
+                if not is_transient_error(e):
+                    # Not the service's fault (bad request, parsing error, ...)
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                attempt += 1
+                remaining = give_up_at - time.monotonic()
+                if attempt > settings["max_retries"] or remaining <= 0:
+                    raise GeminiUnavailableError(
+                        f"{self.model} call failed after {attempt} attempt(s): {e}",
+                        retry_after=self.breaker.retry_after()
+                    ) from e
+                delay = min(settings["max_delay"], settings["base_delay"] * 2 ** (attempt - 1))
+                delay = random.uniform(0, delay)  # full jitter
+                print(f"⚠️  {self.model} transient error ({e}); retrying in {delay:.1f}s")
+                time.sleep(min(delay, remaining))
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    def idle(self):
+        """True if no call is running or waiting for a rate-limit token."""
+        with self._in_flight_lock:
+            running = self.in_flight
+        return running == 0 and self.limiter.wait_time() == 0
+
+    def _finished(self, _future):
+        with self._in_flight_lock:
+            self.in_flight -= 1
+        self.semaphore.release()
+
+    def _attempt(self, fn, args, kwargs, give_up_at):
+        remaining = give_up_at - time.monotonic()
+        if not self.limiter.acquire(timeout=remaining):
+            raise LocalBackpressureError(
+                f"rate limit wait for {self.model} exceeds the deadline",
+                retry_after=self.limiter.wait_time()
+            )
+
+        remaining = give_up_at - time.monotonic()
+        if not self.semaphore.acquire(timeout=max(0.0, remaining)):
+            raise LocalBackpressureError(f"no free {self.model} slot before the deadline")
+
+        try:
+            future = self.executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self.semaphore.release()
+            raise
+        with self._in_flight_lock:
+            self.in_flight += 1
+        # The slot is freed when the call actually finishes, even if we stop waiting for it
+        future.add_done_callback(self._finished)
+
+        # The SDK call times itself out after request_timeout (see NoRetryClient);
+        # waiting a little longer lets that timeout surface as a retryable error
+        wait = self.settings["request_timeout"] + self.settings["timeout_grace"]
+        timeout = min(wait, max(0.0, give_up_at - time.monotonic()))
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if timeout < wait:
+                raise DeadlineExceededError(f"deadline reached after {timeout:.1f}s waiting for {self.model}")
+            raise StalledCallError(f"{self.model} request still running after {timeout:.1f}s")
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(model):
+    """Process-wide guard for a model, shared by every caller."""
+    with _guards_lock:
+        if model not in _guards:
+            _guards[model] = ModelGuard(model)
+        return _guards[model]
+
+
+def configure_model(model, **limits):
+    """Override the limits for a model; takes effect for guards created afterwards."""
+    with _guards_lock:
+        MODEL_LIMITS.setdefault(model, {}).update(limits)
+        _guards.pop(model, None)
+
+
+def split_quota(shares, models=(CHAT_MODEL, EMBEDDING_MODEL)):
+    """Limit this process to 1/`shares` of each model's request quota (multi-process deployments)."""
+    for model in models:
+        limits = dict(DEFAULT_LIMITS)
+        limits.update(MODEL_LIMITS.get(model, {}))
+        configure_model(model, requests_per_minute=max(1, limits["requests_per_minute"] // shares))
+
+
+class GuardedEmbeddings(Embeddings):
+    """Embeddings wrapper that sends every request through the model's guard, in batches."""
+
+    def __init__(self, embeddings, model=EMBEDDING_MODEL, batch_size=100):
+        self.embeddings = embeddings
+        self.guard = get_guard(model)
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts):
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i:i + self.batch_size]
+            vectors.extend(self.guard.call(self.embeddings.embed_documents, batch))
+        return vectors
+
+    def embed_query(self, text):
+        return self.guard.call(self.embeddings.embed_query, text)
+
+
+class NoRetryClient:
+    """
+    Proxy for the google-generativeai API client that makes every generate and
+    embed request with a fixed timeout and without the client library's own
+    retries, so that the model's guard alone times out and retries calls.
+    """
+
+    METHODS = ("generate_content", "stream_generate_content", "embed_content", "batch_embed_contents")
+
+    def __init__(self, client, timeout):
+        self.client = client
+        self.timeout = timeout
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if name in self.METHODS:
+            return functools.partial(attribute, retry=None, timeout=self.timeout)
+        return attribute
+
+
+def request_timeout(model):
+    limits = dict(DEFAULT_LIMITS)
+    limits.update(MODEL_LIMITS.get(model, {}))
+    return limits["request_timeout"]
+
+
+class UnretriedChatModel(ChatGoogleGenerativeAI):
+    """
+    ChatGoogleGenerativeAI without langchain's tenacity retries (up to 10
+    attempts per call); the chat model's guard retries instead.
+    """
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        params, chat, message = self._prepare_chat(messages, stop=stop)
+        return _response_to_result(chat.send_message(content=message, **params))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        params, chat, message = self._prepare_chat(messages, stop=stop)
+        for chunk in chat.send_message(content=message, **params, stream=True):
+            result = _response_to_result(
+                chunk,
+                ai_msg_t=AIMessageChunk,
+                human_msg_t=HumanMessageChunk,
+                chat_msg_t=ChatMessageChunk,
+                generation_t=ChatGenerationChunk,
+            )
+            generation = result.generations[0]
+            yield generation
+            if run_manager:
+                run_manager.on_llm_new_token(generation.text)
+
+
+class UnretriedEmbeddings(GoogleGenerativeAIEmbeddings):
+    """GoogleGenerativeAIEmbeddings whose requests go through a NoRetryClient."""
+
+    def _embed(self, texts, task_type, title=None):
+        client = NoRetryClient(get_default_generative_client(), request_timeout(EMBEDDING_MODEL))
+        try:
+            result = genai.embed_content(
+                model=self.model,
+                content=texts,
+                task_type=self.task_type or "retrieval_document",
+                title=title,
+                client=client,
+            )
+        except Exception as e:
+            raise GoogleGenerativeAIError(f"Error embedding content: {e}") from e
+        return result["embedding"]
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_chat_model(api_key, temperature=0.1):
+    """Process-wide chat model client; its connection is shared by all threads."""
+    key = ("chat", api_key, temperature)
+    with _clients_lock:
+        if key not in _clients:
+            chat_model = UnretriedChatModel(
+                model=CHAT_MODEL,
+                google_api_key=api_key,
+                temperature=temperature
+            )
+            chat_model.client._client = NoRetryClient(get_default_generative_client(), request_timeout(CHAT_MODEL))
+            _clients[key] = chat_model
+        return _clients[key]
+
+
+def get_embeddings(api_key):
+    """Process-wide guarded embeddings client; its connection is shared by all threads."""
+    key = ("embeddings", api_key)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = GuardedEmbeddings(UnretriedEmbeddings(
+                model=EMBEDDING_MODEL,
+                google_api_key=api_key
+            ))
+        return _clients[key]
+
+
+def _reset_after_fork():
+    """A forked child (shard build worker) gets none of the guards' executor threads; start afresh."""
+    global _guards_lock, _clients_lock
+    _guards_lock = threading.Lock()
+    _clients_lock = threading.Lock()
+    _guards.clear()
+    _clients.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,224 @@
+# index_manager.py
+import os
+import time
+import shutil
+import threading
+from enhanced_data_loader import load_documents_enhanced, split_documents_enhanced
+from sharded_index import SHARD_BUILD_WORKERS, build_sharded_index, load_index, chunk_count
+
+VERSIONS_DIR = "versions"
+CURRENT_POINTER = "current"
+
+# Questions every freshly built index must return context for
+VALIDATION_QUERIES = [
+    "Bajaj Finserv stock price",
+    "BAGIC motor insurance",
+]
+
+# Versioned vector indexes with atomic switch-over.
+#
+# Layout under the database root (e.g. chroma_db/):
+#
+#     versions/20250101-093000.123456789/   one complete (sharded) index per build
+#     current                               text file holding the live version name
+#
+# A rebuild writes a new version directory next to the live one, validates it
+# and only then replaces the `current` pointer (write-to-temp + os.replace), so
+# readers always see either the old or the new index. Serving processes watch
+# the pointer with IndexReloader and swap their vector store in place. The
+# previous version is kept for rollback.
+
+
+def _pointer_path(db_root):
+    return os.path.join(db_root, CURRENT_POINTER)
+
+
+def _version_path(db_root, version):
+    return os.path.join(db_root, VERSIONS_DIR, version)
+
+
+def new_version_name():
+    """Build time to the nanosecond, so names are unique and sort by age."""
+    now = time.time_ns()
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now // 10**9))}.{now % 10**9:09d}"
+
+
+def list_versions(db_root):
+    """Built versions, oldest first."""
+    versions_dir = os.path.join(db_root, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(v for v in os.listdir(versions_dir) if os.path.isdir(os.path.join(versions_dir, v)))
+
+
+def current_version(db_root):
+    """Name of the live version, or None if nothing has been published."""
+    try:
+        with open(_pointer_path(db_root)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+
+def current_index_path(db_root):
+    """
+    Directory of the live index. Falls back to a legacy, unversioned index
+    stored directly in `db_root`; returns None if there is no index at all.
+    """
+    version = current_version(db_root)
+    if version:
+        return _version_path(db_root, version)
+    if os.path.isdir(db_root) and any(
+        entry not in (VERSIONS_DIR, CURRENT_POINTER) for entry in os.listdir(db_root)
+    ):
+        return db_root
+    return None
+
+
+def publish_version(db_root, version):
+    """Atomically point `current` at a built version."""
+    if not os.path.isdir(_version_path(db_root, version)):
+        raise ValueError(f"Index version {version} does not exist")
+    tmp_path = _pointer_path(db_root) + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, _pointer_path(db_root))
+    print(f"🔀 Live index is now version {version}")
+
+
+def validate_index(vectordb, expected_chunks):
+    """Check chunk count and that sample queries return context. Returns a list of problems."""
+    problems = []
+    count = chunk_count(vectordb)
+    if count != expected_chunks:
+        problems.append(f"expected {expected_chunks} chunks, index holds {count}")
+    for query in VALIDATION_QUERIES:
+        if not vectordb.similarity_search(query, k=1):
+            problems.append(f"no results for sample query '{query}'")
+    return problems
+
+
+def build_staged_index(data_folder, db_root, api_key, keep=2, shards=None, workers=SHARD_BUILD_WORKERS):
+    """
+    Build a new index version from the data folder, validate it and publish
+    it. The live index is untouched until the final pointer switch. With
+    `shards`, only those shards are re-embedded and the rest are copied from
+    the live version. Returns the new vector store, or None if the build or
+    validation failed.
+    """
+    version = new_version_name()
+    staging_path = _version_path(db_root, version)
+    # Never build into an existing version, even one from a concurrent build
+    os.makedirs(staging_path)
+    print(f"🏗️  Building index version {version} in {staging_path}...")
+
+    documents = load_documents_enhanced(data_folder)
+    if not documents:
+        print("❌ No documents found to process. Please ensure data files are in the 'data' folder.")
+        shutil.rmtree(staging_path, ignore_errors=True)
+        return None
+
+    chunks = split_documents_enhanced(documents)
+    vectordb = build_sharded_index(
+        chunks, staging_path, api_key, workers=workers,
+        reuse_from=current_index_path(db_root), rebuild=shards
+    )
+    if vectordb is None:
+        shutil.rmtree(staging_path, ignore_errors=True)
+        return None
+
+    problems = validate_index(vectordb, vectordb.expected_count())
+    if problems:
+        print(f"❌ Index version {version} failed validation: {'; '.join(problems)}")
+        print("   The live index was left unchanged.")
+        shutil.rmtree(staging_path, ignore_errors=True)
+        return None
+
+    publish_version(db_root, version)
+    prune_versions(db_root, keep=keep)
+    return vectordb
+
+
+def rollback(db_root):
+    """Point `current` back at the version built before it. Returns the version or None."""
+    versions = list_versions(db_root)
+    live = current_version(db_root)
+    older = [v for v in versions if live is None or v < live]
+    if not older:
+        print("❌ No earlier index version to roll back to.")
+        return None
+    publish_version(db_root, older[-1])
+    return older[-1]
+
+
+def prune_versions(db_root, keep=2):
+    """Delete old versions, keeping the newest `keep` and always the live one."""
+    live = current_version(db_root)
+    versions = list_versions(db_root)
+    for version in versions[:-keep] if keep else versions:
+        if version != live:
+            shutil.rmtree(_version_path(db_root, version), ignore_errors=True)
+            print(f"🗑️  Removed old index version {version}")
+
+
+def get_or_create_current_index(data_folder, db_root, api_key):
+    """Load the live index, building and publishing the first version if there is none."""
+    index_path = current_index_path(db_root)
+    if index_path is None:
+        print("📁 No published index found. Building the first version...")
+        return build_staged_index(data_folder, db_root, api_key)
+    print(f"📁 Loading live index from {index_path}...")
+    return load_index(index_path, api_key)
+
+
+class IndexReloader:
+    """
+    Background thread that watches the `current` pointer and swaps the
+    chatbot's vector store when a new version is published.
+    """
+
+    def __init__(self, db_root, chatbot, api_key, interval=5.0):
+        self.db_root = db_root
+        self.chatbot = chatbot
+        self.api_key = api_key
+        self.interval = interval
+        self.version = current_version(db_root)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="index-reloader", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"❌ Index reload error: {e}")
+
+    def check(self):
+        """Reload if the pointer moved. Returns True if the vector store was swapped."""
+        version = current_version(self.db_root)
+        if not version or version == self.version:
+            return False
+        vectordb = load_index(_version_path(self.db_root, version), self.api_key)
+        if vectordb is None:
+            return False
+        # Attribute assignment is atomic: in-flight queries finish on the old store
+        self.chatbot.vector_store = vectordb
+        self.chatbot.invalidate_caches()
+        self.version = version
+        print(f"🔄 Hot-reloaded index version {version}")
+        return True
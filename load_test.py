@@ -0,0 +1,249 @@
+# load_test.py
+import os
+import sys
+import time
+import random
+import hashlib
+import argparse
+import threading
+import contextlib
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_community.vectorstores import Chroma
+from langchain.schema import Document
+from gemini_client import CHAT_MODEL, EMBEDDING_MODEL, GuardedEmbeddings, configure_model
+from enhanced_chatbot_logic import EnhancedBajajChatbot
+from enhanced_data_loader import load_documents_enhanced, split_documents_enhanced
+from stock_store import StockStore
+
+DATA_FOLDER = "data"
+
+# (weight, question): roughly the traffic mix seen from analysts
+QUESTION_MIX = [
+    (20, "What was the highest stock price of Bajaj Finserv in 2022?"),
+    (10, "What was the average stock price in 2023?"),
+    (8, "What was the lowest stock price in January 2022?"),
+    (6, "Compare Bajaj Finance vs Bajaj Finserv stock price in 2023"),
+    (10, "Why is BAGIC facing headwinds in motor insurance business?"),
+    (8, "What's the rationale of Hero partnership?"),
+    (6, "Tell me about organic traffic of Bajaj Markets"),
+    (6, "What are the discussions regarding Allianz stake sale?"),
+    (8, "What are the key financial highlights from Q4 FY25?"),
+    (6, "Act as a CFO of BAGIC and help me draft commentary for upcoming investor call"),
+    (6, "What products does Bajaj Finserv offer?"),
+    (6, "How is the company performing in different business segments?"),
+]
+
+# Used when the data folder is empty so the harness still has something to retrieve
+SYNTHETIC_DOCUMENTS = [
+    "BAGIC motor insurance faced headwinds from higher claims and pricing pressure.",
+    "The Hero partnership gives Bajaj Finserv access to two-wheeler customers.",
+    "Bajaj Markets grew organic traffic through content and search.",
+    "Allianz stake sale discussions progressed during the quarter.",
+    "Q4 FY25 highlights: consolidated revenue and profit grew year on year.",
+    "Bajaj Finserv offers lending, insurance and investment products.",
+]
+
+FAILURE_PREFIXES = ("An error occurred", "The AI service is temporarily busy")
+
+
+class LocalChatModel(SimpleChatModel):
+    """Stand-in for Gemini chat: sleeps for a realistic latency and returns a canned answer."""
+
+    latency: float = 1.5
+    jitter: float = 0.5
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        return "Based on the provided context, here is a summary of the relevant points."
+
+    @property
+    def _llm_type(self):
+        return "local-chat"
+
+
+class LocalEmbeddings(Embeddings):
+    """Stand-in for Gemini embeddings: hashed bag-of-words vectors after a short delay."""
+
+    def __init__(self, size=256, latency=0.05):
+        self.size = size
+        self.latency = latency
+
+    def _vector(self, text):
+        vector = [0.0] * self.size
+        for token in text.lower().split():
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.size] += 1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return self._vector(text)
+
+
+def build_local_chatbot(data_folder, llm_latency, embed_latency, use_caches=False):
+    """
+    Chatbot wired to local stand-ins for Gemini, over the real data folder if
+    present. The answer and retrieval caches are off unless `use_caches`, as
+    the question mix is small and would otherwise be served from memory.
+    """
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        documents = load_documents_enhanced(data_folder) if os.path.isdir(data_folder) else []
+        if documents:
+            chunks = split_documents_enhanced(documents)
+            langchain_documents = [Document(page_content=c["page_content"], metadata=c["metadata"]) for c in chunks]
+        else:
+            langchain_documents = [
+                Document(page_content=text, metadata={"source": "synthetic", "type": "pdf"})
+                for text in SYNTHETIC_DOCUMENTS
+            ]
+        embeddings = GuardedEmbeddings(LocalEmbeddings(latency=embed_latency))
+        vector_store = Chroma.from_documents(
+            documents=langchain_documents,
+            embedding=embeddings,
+            collection_name=f"load-test-{os.getpid()}"
+        )
+
+        stock_store = StockStore()
+        if os.path.isdir(data_folder):
+            stock_store.ingest_folder(data_folder)
+
+    llm = LocalChatModel(latency=llm_latency, jitter=llm_latency / 3)
+    chatbot = EnhancedBajajChatbot(vector_store, api_key="local", stock_store=stock_store, llm=llm)
+    if not use_caches:
+        chatbot.answer_cache_ttl = 0
+        chatbot.retrieval_cache_size = 0
+    return chatbot
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_level(chatbot, users, duration, think_time=0.0, progress_every=None):
+    """Drive `users` concurrent simulated users for `duration` seconds. Returns a stats dict."""
+    weights = [w for w, _ in QUESTION_MIX]
+    questions = [q for _, q in QUESTION_MIX]
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+    start = time.monotonic()
+    stop_at = start + duration
+
+    def user(seed):
+        rng = random.Random(seed)
+        while time.monotonic() < stop_at:
+            question = rng.choices(questions, weights)[0]
+            t0 = time.monotonic()
+            try:
+                answer, _ = chatbot.answer_question(question)
+                failed = answer.startswith(FAILURE_PREFIXES)
+            except Exception:
+                failed = True
+            elapsed = time.monotonic() - t0
+            with lock:
+                latencies.append(elapsed)
+                failures[0] += failed
+            if think_time:
+                time.sleep(rng.expovariate(1.0 / think_time))
+
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(users)]
+    for thread in threads:
+        thread.start()
+
+    if progress_every:
+        while any(t.is_alive() for t in threads):
+            time.sleep(progress_every)
+            with lock:
+                done = list(latencies)
+            elapsed = time.monotonic() - start
+            sys.__stdout__.write(
+                f"  … {elapsed:6.0f}s  {len(done) / elapsed:6.2f} req/s  "
+                f"p95 {percentile(done, 95):.2f}s  failures {failures[0]}\n"
+            )
+
+    for thread in threads:
+        thread.join()
+
+    wall = time.monotonic() - start
+    return {
+        "users": users,
+        "requests": len(latencies),
+        "throughput": len(latencies) / wall,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies, default=0.0),
+        "failures": failures[0],
+    }
+
+
+def print_results(results):
+    print("\n" + "=" * 78)
+    print(f"{'users':>6} {'requests':>9} {'req/s':>8} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'max s':>8} {'failed':>7}")
+    print("-" * 78)
+    for r in results:
+        print(
+            f"{r['users']:>6} {r['requests']:>9} {r['throughput']:>8.2f} {r['p50']:>8.2f} "
+            f"{r['p95']:>8.2f} {r['p99']:>8.2f} {r['max']:>8.2f} {r['failures']:>7}"
+        )
+    print("=" * 78)
+
+    # Saturation: the first level whose extra users add less than 10% throughput
+    for previous, current in zip(results, results[1:]):
+        if current["throughput"] < previous["throughput"] * 1.10:
+            print(f"📈 Saturation at ~{previous['users']} concurrent users "
+                  f"({previous['throughput']:.2f} req/s, p95 {previous['p95']:.2f}s)")
+            break
+    else:
+        if results:
+            print("📈 No saturation reached; try higher concurrency levels.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load / soak test for EnhancedBajajChatbot using local Gemini stand-ins.")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="comma-separated user counts to test")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per concurrency level")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between a user's questions (s)")
+    parser.add_argument("--soak", type=float, default=0.0, help="run one soak test of this many seconds at the highest level")
+    parser.add_argument("--llm-latency", type=float, default=1.5, help="mean stand-in generation latency (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="stand-in embedding latency (s)")
+    parser.add_argument("--rpm", type=int, default=1_000_000, help="chat requests/minute allowed by the guard")
+    parser.add_argument("--llm-concurrency", type=int, default=16, help="concurrent chat calls allowed by the guard")
+    parser.add_argument("--data-folder", default=DATA_FOLDER)
+    parser.add_argument("--with-caches", action="store_true", help="serve repeated questions from the answer and retrieval caches")
+    parser.add_argument("--verbose", action="store_true", help="keep the chatbot's own logging")
+    args = parser.parse_args()
+
+    configure_model(CHAT_MODEL, requests_per_minute=args.rpm, max_concurrency=args.llm_concurrency)
+    configure_model(EMBEDDING_MODEL, requests_per_minute=1_000_000, max_concurrency=64)
+
+    print("🔧 Building chatbot with local Gemini stand-ins...")
+    chatbot = build_local_chatbot(args.data_folder, args.llm_latency, args.embed_latency, use_caches=args.with_caches)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    results = []
+    with quiet:
+        if args.soak:
+            sys.__stdout__.write(f"🧪 Soak test: {levels[-1]} users for {args.soak:.0f}s\n")
+            results.append(run_level(chatbot, levels[-1], args.soak, args.think_time, progress_every=30))
+        else:
+            for users in levels:
+                sys.__stdout__.write(f"🧪 {users} concurrent users for {args.duration:.0f}s...\n")
+                results.append(run_level(chatbot, users, args.duration, args.think_time))
+
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
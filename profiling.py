@@ -0,0 +1,87 @@
+# profiling.py
+import io
+import os
+import re
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+PROFILE_DIR = "profiles"
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+# Only one profiler can be active per interpreter on newer Pythons
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def profile_run(name, output_dir=PROFILE_DIR, enabled=True):
+    """
+    Profile the enclosed block with cProfile and tracemalloc and write a report.
+
+    Produces `<output_dir>/<timestamp>-<name>.txt` (top functions by cumulative
+    time, top allocation sites, peak traced memory) and the raw `.prof` file
+    for tools such as snakeviz. cProfile only sees the calling thread, so time
+    spent in Gemini worker threads shows up as waiting on their futures.
+    If another profiled run is active the block runs unprofiled.
+    """
+    if not enabled or not _profile_lock.acquire(blocking=False):
+        if enabled:
+            print("⚠️  Another profiled run is active; running without profiling.")
+        yield None
+        return
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(10)
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+        try:
+            report_path = write_report(name, output_dir, profiler, snapshot, peak, elapsed)
+            print(f"🧪 Profile written to {report_path}")
+        except Exception as e:
+            print(f"❌ Error writing profile report: {e}")
+        finally:
+            _profile_lock.release()
+
+
+def write_report(name, output_dir, profiler, snapshot, peak, elapsed):
+    """Write the text report and raw stats for one profiled run. Returns the report path."""
+    os.makedirs(output_dir, exist_ok=True)
+    slug = re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')[:60] or "run"
+    base = os.path.join(output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}")
+    profiler.dump_stats(base + ".prof")
+
+    stats_text = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stats_text)
+    stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    stats.sort_stats("tottime").print_stats(TOP_FUNCTIONS)
+
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(f"Profile: {name}\n")
+        f.write(f"Wall time: {elapsed:.3f}s\n")
+        f.write(f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB\n\n")
+        f.write(f"=== Top {TOP_ALLOCATIONS} allocation sites (live at end of run) ===\n")
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            f.write(f"{stat}\n")
+        f.write(f"\n=== Top {TOP_FUNCTIONS} functions (cumulative, then own time) ===\n")
+        f.write(stats_text.getvalue())
+    return base + ".txt"
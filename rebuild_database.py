@@ -1,20 +1,32 @@
 # rebuild_database.py
 import os
-import shutil
+import argparse
 from config import get_api_key
-from enhanced_data_loader import get_or_create_vector_database_enhanced
+from index_manager import build_staged_index, rollback
+from sharded_index import SHARD_BUILD_WORKERS, shard_name
+from stock_store import StockStore
+from facts_store import FactsStore
+from profiling import PROFILE_DIR, profile_run
 
-def rebuild_database():
-    """Rebuild the vector database with enhanced data processing."""
-    print("🔄 Rebuilding vector database with enhanced processing...")
+DATA_FOLDER = "data"
+DB_FOLDER = "chroma_db"
+STOCK_STORE_FOLDER = "stock_store"
+FACTS_STORE_FOLDER = "facts_store"
+
+def rebuild_database(keep_versions=2, shards=None, workers=SHARD_BUILD_WORKERS):
+    """
+    Rebuild the vector database with enhanced data processing.
     
-    DATA_FOLDER = "data"
-    DB_FOLDER = "chroma_db"
+    The new index is built as a separate version and only published once it
+    has been validated, so running chatbots keep serving the current index
+    throughout and hot-reload the new one afterwards. With `shards` (e.g.
+    ["pdf-fy25"]) only those shards are re-embedded; the others are copied
+    from the live index.
     
-    # Remove existing database
-    if os.path.exists(DB_FOLDER):
-        print("🗑️  Removing existing database...")
-        shutil.rmtree(DB_FOLDER)
+    The stock and facts stores are re-ingested only after the new index has
+    been published, and with `shards` only for the data those shards cover.
+    """
+    print("🔄 Rebuilding vector database with enhanced processing...")
     
     # Get API key
     try:
@@ -24,21 +36,50 @@ def rebuild_database():
         print(f"❌ Error: {e}")
         return False
     
-    # Rebuild with enhanced processing
+    # Rebuild with enhanced processing into a new index version
     print("🔄 Creating new enhanced database...")
-    vectordb = get_or_create_vector_database_enhanced(
-        DATA_FOLDER, 
-        DB_FOLDER, 
-        api_key, 
-        force_rebuild=True
-    )
+    vectordb = build_staged_index(DATA_FOLDER, DB_FOLDER, api_key, keep=keep_versions, shards=shards, workers=workers)
     
     if vectordb:
+        refresh_stores(shards)
         print("✅ Enhanced database rebuilt successfully!")
         return True
     else:
-        print("❌ Failed to rebuild database.")
+        print("❌ Failed to rebuild database. The stock and facts stores were left unchanged.")
         return False
 
+def refresh_stores(shards=None):
+    """Re-ingest the stock and facts stores, for all data or only the files in `shards`."""
+    # Re-partition stock price files (partitions are published as new versions)
+    if shards is None or any(name.startswith("stock-") for name in shards):
+        StockStore(STOCK_STORE_FOLDER).ingest_folder(DATA_FOLDER, force=True)
+    
+    # Re-extract reported figures from the PDFs
+    facts_store = FactsStore(FACTS_STORE_FOLDER)
+    if shards is None:
+        facts_store.ingest_folder(DATA_FOLDER, force=True)
+        return
+    for filename in sorted(os.listdir(DATA_FOLDER)):
+        if filename.endswith(".pdf") and shard_name({"type": "pdf", "source": filename}) in shards:
+            facts_store.ingest_file(os.path.join(DATA_FOLDER, filename), force=True)
+
 if __name__ == "__main__":
-    rebuild_database() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Rebuild the Bajaj Finserv vector database.")
+    parser.add_argument("--rollback", action="store_true", help="switch back to the previous index version")
+    parser.add_argument("--keep", type=int, default=2, help="number of index versions to keep (default: 2)")
+    parser.add_argument("--shard", action="append", help="rebuild only this shard, e.g. pdf-fy25 (repeatable)")
+    parser.add_argument("--workers", type=int, default=SHARD_BUILD_WORKERS, help=f"parallel shard build processes (default: {SHARD_BUILD_WORKERS})")
+    parser.add_argument("--profile", action="store_true", help="write a cProfile/tracemalloc report for the rebuild")
+    parser.add_argument("--profile-dir", default=PROFILE_DIR, help=f"directory for profiling reports (default: {PROFILE_DIR})")
+    args = parser.parse_args()
+    
+    if args.rollback:
+        rollback(DB_FOLDER)
+    else:
+        workers = args.workers
+        if args.profile and workers > 1:
+            # cProfile only sees this process; build process work would show up as future waits
+            print("📈 Profiling: building shards in this process (--workers 1)")
+            workers = 1
+        with profile_run("rebuild-database", args.profile_dir, enabled=args.profile):
+            rebuild_database(keep_versions=args.keep, shards=args.shard, workers=workers) 
\ No newline at end of file
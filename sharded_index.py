@@ -0,0 +1,319 @@
+# sharded_index.py
+import os
+import re
+import json
+import shutil
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores import Chroma
+from gemini_client import EMBEDDING_MODEL, get_embeddings, split_quota
+from enhanced_data_loader import create_vector_database_enhanced, load_vector_database_enhanced
+
+SHARDS_DIR = "shards"
+SHARD_MANIFEST = "shards.json"
+SHARD_BUILD_WORKERS = 4
+SEARCH_WORKERS = 8
+
+# Shard name prefix per document type
+SHARD_PREFIXES = {"stock_data": "stock", "pdf": "pdf", "csv": "csv"}
+UNDATED = "undated"
+
+# Not \b: file names join words with underscores ("Earnings_Call_FY25.pdf",
+# "BFS_Q4FY25_Transcript.pdf"), and "_" and digits count as word characters
+FISCAL_YEAR_PATTERN = re.compile(r"(?<![a-z])FY[\s'-]?(\d{4}|\d{2})(?!\d)", re.IGNORECASE)
+# A bare number is a calendar year only with date context ("in 2023",
+# "March 2023", "CY2023", "from 2022 to 2023"), not in "PAT crossed 2000 crore"
+YEAR_PATTERN = re.compile(
+    r"(?:\b(?:in|for|during|of|since|from|to|till|until|between|and|vs|versus|year|"
+    r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|"
+    r"sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?,?\s+(?:\d{1,2}(?:st|nd|rd|th)?,?\s+)?"
+    r"|\bCY\s*'?)((?:19|20)\d{2})\b(?!\s*(?:crores?|cr|lakhs?|bn|billion|mn|million|%|bps|shares|points)\b)",
+    re.IGNORECASE
+)
+
+# Sharded vector index.
+#
+# Layout of one index version (see index_manager):
+#
+#     shards.json            shard name -> document type, fiscal year, chunk count
+#     shards/pdf-fy25/       one complete Chroma index per shard
+#     shards/stock-fy24/
+#     shards/pdf-undated/    documents without a fiscal year
+#
+# Chunks are sharded by document type and Indian fiscal year (April-March,
+# named by the year it ends). Shards are built in parallel processes and
+# opened lazily, so old years stay cold on disk until a question needs them.
+# A search embeds the question once, queries the shards for the years it
+# mentions (all shards if none) concurrently and merges the top-k by distance.
+
+
+def fiscal_year_of(metadata):
+    """Fiscal year a chunk belongs to, or None if it is undated."""
+    end_date = metadata.get("end_date")
+    if end_date:
+        year, month = int(end_date[:4]), int(end_date[5:7])
+        return year + (month >= 4)
+    match = FISCAL_YEAR_PATTERN.search(metadata.get("source", ""))
+    if match:
+        return 2000 + int(match.group(1)) % 100
+    return None
+
+
+def shard_name(metadata):
+    """Shard for a chunk, e.g. 'pdf-fy25' or 'pdf-undated'."""
+    doc_type = metadata.get("type", "")
+    prefix = SHARD_PREFIXES.get(doc_type) or re.sub(r'[^a-z0-9]', '', doc_type.lower()) or "misc"
+    fiscal_year = fiscal_year_of(metadata)
+    if fiscal_year is None:
+        return f"{prefix}-{UNDATED}"
+    return f"{prefix}-fy{fiscal_year % 100:02d}"
+
+
+def fiscal_years_in_question(question):
+    """Fiscal years a question refers to; a calendar year overlaps two fiscal years."""
+    years = {2000 + int(y) % 100 for y in FISCAL_YEAR_PATTERN.findall(question)}
+    for year in YEAR_PATTERN.findall(FISCAL_YEAR_PATTERN.sub(" ", question)):
+        years.update((int(year), int(year) + 1))
+    return years
+
+
+def group_chunks_by_shard(chunks):
+    shards = defaultdict(list)
+    for chunk in chunks:
+        shards[shard_name(chunk["metadata"])].append(chunk)
+    return dict(shards)
+
+
+def _shard_path(index_path, name):
+    return os.path.join(index_path, SHARDS_DIR, name)
+
+
+def read_manifest(index_path):
+    with open(os.path.join(index_path, SHARD_MANIFEST), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(index_path, manifest):
+    path = os.path.join(index_path, SHARD_MANIFEST)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def is_sharded_index(index_path):
+    return os.path.exists(os.path.join(index_path, SHARD_MANIFEST))
+
+
+def _shard_info(chunks):
+    metadata = chunks[0]["metadata"]
+    return {"doc_type": metadata.get("type"), "fiscal_year": fiscal_year_of(metadata), "chunks": len(chunks)}
+
+
+def _init_build_worker(workers):
+    """Give each build process its share of the embedding quota."""
+    split_quota(workers, models=(EMBEDDING_MODEL,))
+
+
+def _build_shard(name, chunks, shard_path, api_key):
+    """Embed one shard into its own Chroma index. Runs in a build process."""
+    vectordb = create_vector_database_enhanced(chunks, shard_path, api_key)
+    if vectordb is None:
+        raise RuntimeError(f"failed to build shard {name}")
+    return vectordb._collection.count()
+
+
+def build_sharded_index(chunks, index_path, api_key, workers=SHARD_BUILD_WORKERS, reuse_from=None, rebuild=None):
+    """
+    Build a sharded index in `index_path`. With `reuse_from` (a sharded index)
+    and `rebuild` (shard names), only those shards are embedded again and the
+    others are copied from `reuse_from`. Returns a ShardedVectorStore or None.
+    """
+    shards = group_chunks_by_shard(chunks)
+    manifest = {"shards": {}}
+    to_build = shards
+
+    if reuse_from and rebuild and is_sharded_index(reuse_from):
+        previous = read_manifest(reuse_from)["shards"]
+        to_build = {name: c for name, c in shards.items() if name in rebuild or name not in previous}
+        for name, info in previous.items():
+            # A rebuilt shard with no chunks left is dropped, not copied
+            if name not in to_build and name not in rebuild:
+                shutil.copytree(_shard_path(reuse_from, name), _shard_path(index_path, name))
+                manifest["shards"][name] = info
+        print(f"♻️  Reusing {len(manifest['shards'])} shard(s) from {reuse_from}")
+
+    print(f"🧩 Building {len(to_build)} shard(s): {', '.join(sorted(to_build))}")
+    try:
+        if workers > 1 and len(to_build) > 1:
+            workers = min(workers, len(to_build))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_build_worker, initargs=(workers,)) as pool:
+                futures = {
+                    name: pool.submit(_build_shard, name, c, _shard_path(index_path, name), api_key)
+                    for name, c in to_build.items()
+                }
+                for future in futures.values():
+                    future.result()
+        else:
+            for name, c in to_build.items():
+                _build_shard(name, c, _shard_path(index_path, name), api_key)
+    except Exception as e:
+        print(f"❌ Error building sharded index: {e}")
+        return None
+
+    for name, c in to_build.items():
+        manifest["shards"][name] = _shard_info(c)
+    write_manifest(index_path, manifest)
+    print(f"✅ Sharded index with {len(manifest['shards'])} shard(s) written to {index_path}")
+    return ShardedVectorStore(index_path, api_key)
+
+
+def load_index(index_path, api_key):
+    """Open an index directory, sharded or a legacy single collection."""
+    if is_sharded_index(index_path):
+        print(f"✅ Sharded index loaded from {index_path}")
+        return ShardedVectorStore(index_path, api_key)
+    return load_vector_database_enhanced(index_path, api_key)
+
+
+def chunk_count(vectordb):
+    if isinstance(vectordb, ShardedVectorStore):
+        return vectordb.count()
+    return vectordb._collection.count()
+
+
+_search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="shard-search")
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    Vector store over the shards of one index. Shards are opened on first
+    use; searches fan out to the relevant shards concurrently. New chunks
+    are routed to their shard, which is created if needed.
+    """
+
+    def __init__(self, index_path, api_key, embedding=None):
+        self.index_path = index_path
+        self.api_key = api_key
+        self._embedding = embedding if embedding is not None else get_embeddings(api_key)
+        self.manifest = read_manifest(index_path)
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def shard_names(self):
+        with self._lock:
+            return sorted(self.manifest["shards"])
+
+    def shard(self, name):
+        """Open (once) and return the Chroma index of a shard."""
+        with self._lock:
+            if name not in self._shards:
+                self._shards[name] = Chroma(
+                    persist_directory=_shard_path(self.index_path, name),
+                    embedding_function=self._embedding
+                )
+            return self._shards[name]
+
+    def select_shards(self, query):
+        """
+        Shards for the fiscal years mentioned in the query plus undated shards;
+        all shards if the query names no year or no shard covers its years.
+        """
+        years = fiscal_years_in_question(query)
+        with self._lock:
+            shards = self.manifest["shards"]
+            if not any(info["fiscal_year"] in years for info in shards.values()):
+                return sorted(shards)
+            return sorted(
+                name for name, info in shards.items()
+                if info["fiscal_year"] is None or info["fiscal_year"] in years
+            )
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        """Top-k (document, distance) pairs across the relevant shards, closest first."""
+        names = self.select_shards(query)
+        if not names:
+            return []
+        embedding = self._embedding.embed_query(query)
+        futures = [
+            _search_executor.submit(
+                self.shard(name).similarity_search_by_vector_with_relevance_scores, embedding, k, filter
+            )
+            for name in names
+        ]
+        results = [pair for future in futures for pair in future.result()]
+        results.sort(key=lambda pair: pair[1])
+        return results[:k]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Shards use Chroma's default L2 distance
+        return self._euclidean_relevance_score_fn
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        """Add chunks to their shards, creating shards that do not exist yet."""
+        metadatas = metadatas or [{} for _ in texts]
+        grouped = defaultdict(lambda: ([], []))
+        for text, metadata in zip(texts, metadatas):
+            shard_texts, shard_metadatas = grouped[shard_name(metadata)]
+            shard_texts.append(text)
+            shard_metadatas.append(metadata)
+
+        ids = []
+        for name, (shard_texts, shard_metadatas) in grouped.items():
+            ids.extend(self.shard(name).add_texts(shard_texts, shard_metadatas))
+            with self._lock:
+                info = self.manifest["shards"].setdefault(name, {
+                    "doc_type": shard_metadatas[0].get("type"),
+                    "fiscal_year": fiscal_year_of(shard_metadatas[0]),
+                    "chunks": 0
+                })
+                info["chunks"] += len(shard_texts)
+                write_manifest(self.index_path, self.manifest)
+        return ids
+
+    def shards_with_source(self, filename):
+        """Shards holding chunks of a data file."""
+        return [name for name in self.shard_names() if self.shard(name).get(where={"source": filename}, limit=1)["ids"]]
+
+    def get(self, where=None, **kwargs):
+        """Chroma-style `get` merged across all shards."""
+        merged = {"ids": [], "metadatas": [], "documents": []}
+        for name in self.shard_names():
+            result = self.shard(name).get(where=where, **kwargs)
+            for key in merged:
+                merged[key].extend(result.get(key) or [])
+        return merged
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return
+        for name in self.shard_names():
+            shard = self.shard(name)
+            present = shard.get(ids=ids)["ids"]
+            if present:
+                shard.delete(present)
+                with self._lock:
+                    self.manifest["shards"][name]["chunks"] -= len(present)
+                    write_manifest(self.index_path, self.manifest)
+
+    def count(self):
+        """Chunks actually stored, summed over all shards."""
+        return sum(self.shard(name)._collection.count() for name in self.shard_names())
+
+    def expected_count(self):
+        """Chunks recorded in the manifest."""
+        with self._lock:
+            return sum(info["chunks"] for info in self.manifest["shards"].values())
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Build sharded indexes with build_sharded_index")
@@ -8,8 +8,13 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import chatbot components
 from config import get_api_key
-from enhanced_data_loader import get_or_create_vector_database_enhanced
-from enhanced_chatbot_logic import build_enhanced_rag_chain, answer_question_enhanced
+from index_manager import get_or_create_current_index, current_version, IndexReloader
+from cache_warmer import QUERY_LOG_PATH, build_warmup_questions, load_precomputed, start_cache_warming
+from enhanced_chatbot_logic import build_enhanced_rag_chain, answer_question_enhanced, QUICK_EXAMPLES
+from stock_store import StockStore
+from facts_store import FactsStore
+from data_watcher import DataFolderWatcher
+from chat_history import ChatHistory, prune_chat_histories
 
 # Page config
 st.set_page_config(
@@ -18,9 +23,14 @@ st.set_page_config(
     layout="centered"
 )
 
+# Newest messages always shown; older ones are shown a page at a time on request
+VISIBLE_MESSAGES = 20
+PAGE_SIZE = 20
+
 # Initialize session state
-if 'messages' not in st.session_state:
-    st.session_state.messages = []
+if 'history' not in st.session_state:
+    prune_chat_histories()
+    st.session_state.history = ChatHistory()
 if 'chatbot' not in st.session_state:
     st.session_state.chatbot = None
 if 'initialized' not in st.session_state:
@@ -28,35 +38,56 @@ if 'initialized' not in st.session_state:
 if 'processing' not in st.session_state:
     st.session_state.processing = False
 
+@st.cache_resource(show_spinner=False)
+def load_chatbot():
+    """
+    Build the chatbot and start its background threads once per process;
+    every browser session shares them. Raises on failure so a failed
+    attempt is not cached and the next click retries.
+    """
+    # Get API key
+    api_key = get_api_key()
+    
+    # Setup paths
+    DATA_FOLDER = "data"
+    DB_FOLDER = "chroma_db"
+    STOCK_STORE_FOLDER = "stock_store"
+    FACTS_STORE_FOLDER = "facts_store"
+    
+    # Initialize vector database
+    vector_store = get_or_create_current_index(DATA_FOLDER, DB_FOLDER, api_key)
+    if vector_store is None:
+        raise RuntimeError("Failed to load database")
+    
+    # Index stock price files (loaded per ticker on first query)
+    stock_store = StockStore(STOCK_STORE_FOLDER)
+    stock_store.ingest_folder(DATA_FOLDER)
+    
+    # Extract reported figures from new or changed PDFs
+    facts_store = FactsStore(FACTS_STORE_FOLDER)
+    facts_store.ingest_folder(DATA_FOLDER)
+    
+    # Build chatbot
+    chatbot = build_enhanced_rag_chain(vector_store, api_key, stock_store=stock_store, facts_store=facts_store)
+    if chatbot is None:
+        raise RuntimeError("Failed to build chatbot")
+    
+    # Serve precomputed answers and warm the rest in the background
+    chatbot.query_log_path = QUERY_LOG_PATH
+    load_precomputed(chatbot, index_version=current_version(DB_FOLDER))
+    start_cache_warming(chatbot, build_warmup_questions(QUERY_LOG_PATH))
+    
+    # Pick up new or changed data files in the background
+    chatbot.data_watcher = DataFolderWatcher(DATA_FOLDER, chatbot, DB_FOLDER, api_key).start()
+    # Switch to new index versions published by rebuild_database.py
+    chatbot.index_reloader = IndexReloader(DB_FOLDER, chatbot, api_key).start()
+    return chatbot
+
 def initialize_chatbot():
-    """Initialize the chatbot."""
+    """Attach the shared chatbot to this session, building it on first use."""
     try:
         with st.spinner("Initializing..."):
-            # Get API key
-            api_key = get_api_key()
-            
-            # Setup paths
-            DATA_FOLDER = "data"
-            DB_FOLDER = "chroma_db"
-            STOCK_DATA_PATH = os.path.join(DATA_FOLDER, "BFS_Share_Price.csv")
-            
-            # Initialize vector database
-            vector_store = get_or_create_vector_database_enhanced(
-                DATA_FOLDER, DB_FOLDER, api_key, force_rebuild=False
-            )
-            
-            if vector_store is None:
-                st.error("Failed to load database")
-                return False
-            
-            # Build chatbot
-            chatbot = build_enhanced_rag_chain(vector_store, api_key, STOCK_DATA_PATH)
-            
-            if chatbot is None:
-                st.error("Failed to build chatbot")
-                return False
-            
-            st.session_state.chatbot = chatbot
+            st.session_state.chatbot = load_chatbot()
             st.session_state.initialized = True
             return True
             
@@ -64,6 +95,35 @@ def initialize_chatbot():
         st.error(f"Error: {str(e)}")
         return False
 
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_history_page(path, start, end, _history):
+    """Messages never change once added, so each older page is read and parsed once."""
+    return _history.messages(start, end)
+
+def render_message(message):
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+
+def render_history(history):
+    """Render the newest messages, plus one page of older messages if requested."""
+    # Widget labels and limits stay fixed so new messages do not reset them
+    older = max(0, len(history) - VISIBLE_MESSAGES)
+    if older and st.checkbox("📜 Show earlier messages", key="show_earlier_messages"):
+        pages = (older + PAGE_SIZE - 1) // PAGE_SIZE
+        page = 1
+        if pages > 1:
+            page = st.number_input("Page (1 = most recent)", min_value=1, value=1, key="history_page")
+            page = min(int(page), pages)
+        st.caption(f"{older} earlier messages, page {page} of {pages}")
+        end = older - (page - 1) * PAGE_SIZE
+        start = max(0, end - PAGE_SIZE)
+        for message in load_history_page(history.path, start, end, history):
+            render_message(message)
+        st.divider()
+    
+    for message in history.tail(VISIBLE_MESSAGES):
+        render_message(message)
+
 # ... existing code ...
 
 def main():
@@ -81,19 +141,16 @@ def main():
 
         st.divider()
         st.header("Example Questions")
-        examples = [
-            "What was the highest stock price in 2022?",
-            "What was the average stock price in 2023?",
-            "What was the lowest stock price in January 2022?",
-            "Compare stock prices from 2022 to 2023"
-        ]
-        for example in examples:
+        for example in QUICK_EXAMPLES:
             if st.button(example, key=f"ex_{hash(example)}"):
                 if not st.session_state.processing:
                     st.session_state.example_question = example
         st.divider()
+        profile_questions = st.checkbox("Profile questions", help="Write a cProfile/tracemalloc report for each question to the profiles/ folder")
         if st.button("Clear Chat"):
-            st.session_state.messages = []
+            # A fresh history (new file) so cached pages of the old one are never reused
+            st.session_state.history.clear()
+            st.session_state.history = ChatHistory()
 
     if not st.session_state.initialized:
         st.info("👈 Click 'Initialize Chatbot' in the sidebar to start")
@@ -106,12 +163,10 @@ def main():
     # Debug info (optional)
     if st.checkbox("Show debug info"):
         st.write(f"Processing: {st.session_state.processing}")
-        st.write(f"Messages count: {len(st.session_state.messages)}")
+        st.write(f"Messages count: {len(st.session_state.history)} ({st.session_state.history.spilled} on disk)")
 
     # Display chat messages
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    render_history(st.session_state.history)
 
     # Handle example question or chat input
     user_input = None
@@ -129,7 +184,7 @@ def main():
         st.session_state.processing = True
         
         # Add user message
-        st.session_state.messages.append({"role": "user", "content": user_input})
+        st.session_state.history.append("user", user_input)
         
         # Display user message
         with st.chat_message("user"):
@@ -148,7 +203,7 @@ def main():
                     
                     if is_stock_query:
                         # Use the enhanced chatbot for stock queries
-                        answer, sources = answer_question_enhanced(st.session_state.chatbot, user_input)
+                        answer, sources = answer_question_enhanced(st.session_state.chatbot, user_input, profile=profile_questions)
                     else:
                         # Provide helpful responses for non-stock queries
                         if "bajaj finserv" in user_input.lower() or "what is" in user_input.lower():
@@ -163,23 +218,23 @@ def main():
                             answer = "I can help you with Bajaj Finserv stock prices, financial performance, and business insights. Please ask specific questions about stock prices, dates, or financial metrics."
                         sources = []
                     
-                    # Check if response took too long
-                    if time.time() - start_time > 30:  # 30 second timeout
-                        st.warning("Response took longer than expected. Please try again.")
-                        answer = "I'm having trouble processing your request. Please try rephrasing your question."
+                    # Gemini calls are rate limited and bounded by deadlines inside the
+                    # chatbot, so a slow or overloaded model returns a fallback answer
+                    if time.time() - start_time > 30:
+                        st.caption(f"⏱️ Answered in {time.time() - start_time:.0f}s")
                     
                     st.markdown(answer)
-                    st.session_state.messages.append({"role": "assistant", "content": answer})
+                    st.session_state.history.append("assistant", answer)
                 except Exception as e:
                     error_msg = f"Error: {str(e)}"
                     st.error(error_msg)
-                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                    st.session_state.history.append("assistant", error_msg)
                     
                     # Additional fallback for RAG errors
                     if "general" in str(e).lower() or "context" in str(e).lower():
                         fallback_answer = "I'm having trouble finding specific information for your question. Please try asking about stock prices, business insights, or financial analysis with more specific details."
                         st.markdown(fallback_answer)
-                        st.session_state.messages.append({"role": "assistant", "content": fallback_answer})
+                        st.session_state.history.append("assistant", fallback_answer)
         
         # Reset processing flag
         st.session_state.processing = False
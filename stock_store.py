@@ -0,0 +1,465 @@
+# stock_store.py
+import os
+import re
+import json
+import time
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Known tickers: ticker -> (display name, aliases used to spot it in a question)
+COMPANY_TICKERS = {
+    "BAJAJFINSV": ("Bajaj Finserv", ["bajaj finserv", "finserv", "bfs"]),
+    "BAJFINANCE": ("Bajaj Finance", ["bajaj finance", "bajfinance", "bfl"]),
+    "BAJAJ-AUTO": ("Bajaj Auto", ["bajaj auto"]),
+    "BAJAJHLDNG": ("Bajaj Holdings & Investment", ["bajaj holdings", "bhil"]),
+}
+
+# Filename prefixes used by the price exports in the data folder
+FILE_PREFIX_TICKERS = {
+    "BFS": "BAJAJFINSV",
+    "BAF": "BAJFINANCE",
+    "BFL": "BAJFINANCE",
+    "BAL": "BAJAJ-AUTO",
+    "BHIL": "BAJAJHLDNG",
+}
+
+DEFAULT_TICKER = "BAJAJFINSV"
+SYMBOL_COLUMNS = ["Symbol", "Ticker"]
+MANIFEST_FILE = "manifest.json"
+
+
+def ticker_for_file(filename):
+    """Work out the ticker a price file belongs to from its name."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    stem = re.sub(r'[_\- ]*(share[_\- ]*)?price(s)?$', '', stem, flags=re.IGNORECASE)
+    key = stem.upper()
+    if key in FILE_PREFIX_TICKERS:
+        return FILE_PREFIX_TICKERS[key]
+    if key in COMPANY_TICKERS:
+        return key
+    return re.sub(r'[^A-Z0-9\-]+', '', key) or DEFAULT_TICKER
+
+
+def display_name(ticker):
+    """Human readable company name for a ticker."""
+    if ticker in COMPANY_TICKERS:
+        return COMPANY_TICKERS[ticker][0]
+    return ticker
+
+
+# Intraday exports use short column names; map them onto the daily CSV names
+PRICE_COLUMN_ALIASES = {
+    "open": "Open Price",
+    "high": "High Price",
+    "low": "Low Price",
+    "close": "Close Price",
+    "volume": "No.of Shares",
+}
+TIMESTAMP_COLUMNS = ["Datetime", "Timestamp", "Date"]
+
+# How each column is rolled up when bars are resampled to a coarser period
+PRICE_AGGREGATIONS = {
+    "Open Price": "first",
+    "High Price": "max",
+    "Low Price": "min",
+    "Close Price": "last",
+    "WAP": "mean",
+    "No.of Shares": "sum",
+    "No. of Trades": "sum",
+    "Total Turnover (Rs.)": "sum",
+    "Deliverable Quantity": "sum",
+}
+
+# Resample rules for the periods served by StockStore.get
+RESAMPLE_RULES = {"D": "D", "W": "W", "M": "MS", "Q": "QS"}
+PARTITION_LAYOUT = 3
+# Partition versions kept per ticker (the live one and the one before it, for
+# readers that have not picked up the new manifest yet)
+KEEP_PARTITION_VERSIONS = 2
+
+
+def parse_timestamps(values):
+    """Parse dates such as "3-Jan-22", falling back to pandas' own inference."""
+    try:
+        return pd.to_datetime(values, format='%d-%b-%y')
+    except Exception:
+        return pd.to_datetime(values)
+
+
+def normalize_price_columns(df):
+    """Rename intraday-style columns and build a single 'Date' timestamp column."""
+    renames = {
+        column: PRICE_COLUMN_ALIASES[column.strip().lower()]
+        for column in df.columns
+        if column.strip().lower() in PRICE_COLUMN_ALIASES and PRICE_COLUMN_ALIASES[column.strip().lower()] not in df.columns
+    }
+    df = df.rename(columns=renames)
+
+    for column in TIMESTAMP_COLUMNS:
+        if column in df.columns:
+            if column == 'Date' and 'Time' in df.columns:
+                df['Date'] = pd.to_datetime(df['Date'].astype(str) + ' ' + df['Time'].astype(str))
+                df = df.drop(columns=['Time'])
+            else:
+                df['Date'] = parse_timestamps(df[column])
+                if column != 'Date':
+                    df = df.drop(columns=[column])
+            break
+    return df
+
+
+def is_price_frame(df):
+    """True if a (normalized) frame looks like stock price data."""
+    return 'Date' in df.columns and 'Close Price' in df.columns
+
+
+def compact_frame(df):
+    """
+    Convert a price frame to the compact in-memory layout: a sorted
+    datetime64 index named 'Date', float32 prices and int32 counts.
+    Non-numeric columns are dropped.
+    """
+    df = df.set_index(pd.DatetimeIndex(df['Date'], name='Date')).drop(columns=['Date']).sort_index()
+    compact = {}
+    for column in df.columns:
+        values = df[column]
+        if values.dtype == object:
+            values = pd.to_numeric(values.astype(str).str.replace(',', ''), errors='coerce')
+            if values.isna().all():
+                continue
+        if pd.api.types.is_integer_dtype(values):
+            if values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max:
+                values = values.astype(np.int32)
+        elif pd.api.types.is_float_dtype(values):
+            values = values.astype(np.float32)
+        else:
+            continue
+        compact[column] = values
+    return pd.DataFrame(compact, index=df.index)
+
+
+def is_intraday(index):
+    """True if an index holds more than one bar per day."""
+    return bool((index != index.normalize()).any() or index.normalize().has_duplicates)
+
+
+def resample_prices(compact, freq="D"):
+    """
+    Roll a compact price frame up to daily ('D'), weekly ('W'), monthly ('M')
+    or quarterly ('Q') bars. Returns a frame with a 'Date' column, the shape
+    the rest of the code expects; `freq=None` returns the raw bars.
+    """
+    if freq is None:
+        return compact
+    rule = RESAMPLE_RULES.get(freq, freq)
+    if rule == "D" and not is_intraday(compact.index):
+        return compact.reset_index()
+    aggregations = {column: PRICE_AGGREGATIONS.get(column, "last") for column in compact.columns}
+    resampled = compact.resample(rule).agg(aggregations).dropna(subset=['Close Price'])
+    return resampled.reset_index()
+
+
+def read_price_csv(filepath):
+    """Read a daily or intraday price CSV into a frame with a parsed 'Date' column."""
+    return normalize_price_columns(pd.read_csv(filepath))
+
+
+def split_by_ticker(df, filename):
+    """Split a price frame into {ticker: frame}, honouring a Symbol/Ticker column."""
+    for column in SYMBOL_COLUMNS:
+        if column in df.columns:
+            return {
+                str(symbol).upper(): group.drop(columns=[column]).reset_index(drop=True)
+                for symbol, group in df.groupby(column, sort=False)
+            }
+    return {ticker_for_file(filename): df}
+
+
+class StockStore:
+    """
+    Ticker-partitioned store for stock price data.
+
+    Each ticker is written to its own partition directory (one .npy file per
+    column plus the datetime64 index) and only read back the first time it is
+    queried. A re-ingested ticker is written to a new version directory,
+    `<root_dir>/<ticker>/<version>/`, which is renamed into place when
+    complete and published by atomically replacing the manifest, the same
+    way index versions are published; readers reload the manifest when it
+    changes, so they never mix column files from two versions. Bars are
+    held in the compact layout from `compact_frame`, so daily and intraday
+    (e.g. minute) data share one code path; `get` serves daily, weekly,
+    monthly or quarterly aggregates and caches each resample.
+    At most `max_hot_tickers` partitions are kept in memory; the least
+    recently used one (and its cached resamples) is dropped when that limit
+    is exceeded. Without a `root_dir` the store keeps no partitions on disk
+    and re-reads the source CSV on load instead.
+    """
+
+    def __init__(self, root_dir=None, max_hot_tickers=4):
+        self.root_dir = root_dir
+        self.max_hot_tickers = max_hot_tickers
+        self._manifest = {}
+        self._manifest_mtime = None
+        self._hot = OrderedDict()
+        self._resampled = {}
+        self._lock = threading.RLock()
+
+        if root_dir:
+            os.makedirs(root_dir, exist_ok=True)
+            self._refresh_manifest()
+
+    # --- Ingestion ---
+
+    def ingest_folder(self, folder_path, force=False):
+        """Ingest every price CSV in a folder, skipping files that are unchanged unless forced."""
+        tickers = []
+        if not os.path.isdir(folder_path):
+            return tickers
+        for filename in sorted(os.listdir(folder_path)):
+            if filename.endswith(".csv"):
+                tickers.extend(self.ingest_file(os.path.join(folder_path, filename), force=force))
+        return tickers
+
+    def ingest_file(self, filepath, force=False):
+        """Ingest one price CSV into per-ticker partitions. Returns the tickers it holds."""
+        source = os.path.abspath(filepath)
+        mtime = os.path.getmtime(source)
+
+        with self._lock:
+            self._refresh_manifest()
+            known = [t for t, entry in self._manifest.items() if entry["source"] == source]
+            if known and not force and all(
+                self._manifest[t]["mtime"] == mtime and self._manifest[t].get("layout") == PARTITION_LAYOUT
+                for t in known
+            ):
+                return known
+
+        try:
+            df = read_price_csv(source)
+        except Exception as e:
+            print(f"❌ Error reading price file {os.path.basename(source)}: {e}")
+            return []
+        if not is_price_frame(df):
+            return []
+
+        partitions = {
+            ticker: compact_frame(frame)
+            for ticker, frame in split_by_ticker(df, source).items()
+        }
+        del df
+        with self._lock:
+            for ticker, compact in partitions.items():
+                entry = {
+                    "source": source,
+                    "mtime": mtime,
+                    "layout": PARTITION_LAYOUT,
+                    "rows": len(compact),
+                    "start": compact.index.min().strftime('%Y-%m-%d %H:%M'),
+                    "end": compact.index.max().strftime('%Y-%m-%d %H:%M'),
+                    "intraday": is_intraday(compact.index),
+                    "columns": list(compact.columns),
+                }
+                if self.root_dir:
+                    entry["version"] = self._write_partition(ticker, compact)
+                self._manifest[ticker] = entry
+                self._drop(ticker)
+            self._save_manifest()
+            for ticker in partitions:
+                self._prune_partitions(ticker)
+
+        print(f"✅ Ingested price file {os.path.basename(source)}: {', '.join(partitions)}")
+        return list(partitions)
+
+    def remove_file(self, filepath):
+        """Forget every ticker that was ingested from a (deleted) price file."""
+        source = os.path.abspath(filepath)
+        with self._lock:
+            self._refresh_manifest()
+            removed = [t for t, entry in self._manifest.items() if entry["source"] == source]
+            for ticker in removed:
+                del self._manifest[ticker]
+                self._drop(ticker)
+            self._save_manifest()
+        return removed
+
+    def _partition_dir(self, ticker, version=None):
+        """Directory of one partition version (layouts before 3 had no versions)."""
+        if version is None:
+            return os.path.join(self.root_dir, ticker)
+        return os.path.join(self.root_dir, ticker, version)
+
+    def _write_partition(self, ticker, compact):
+        """Write a new partition version and rename it into place. Returns the version name."""
+        # Sortable by write time, unique within a second
+        now = time.time_ns()
+        version = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now // 10**9))}.{now % 10**9:09d}"
+        partition_dir = self._partition_dir(ticker, version)
+        staging_dir = partition_dir + ".tmp"
+        os.makedirs(staging_dir)
+        np.save(os.path.join(staging_dir, "index.npy"), compact.index.to_numpy(dtype='datetime64[ns]'))
+        for i, column in enumerate(compact.columns):
+            np.save(os.path.join(staging_dir, f"col_{i}.npy"), compact[column].to_numpy())
+        os.rename(staging_dir, partition_dir)
+        return version
+
+    def _prune_partitions(self, ticker):
+        """Delete all but the newest KEEP_PARTITION_VERSIONS versions of a ticker, and pre-version files."""
+        if not self.root_dir:
+            return
+        ticker_dir = self._partition_dir(ticker)
+        if not os.path.isdir(ticker_dir):
+            return
+        live = self._manifest.get(ticker, {}).get("version")
+        versions = sorted(
+            v for v in os.listdir(ticker_dir)
+            if os.path.isdir(os.path.join(ticker_dir, v)) and not v.endswith(".tmp")
+        )
+        stale = [v for v in versions[:-KEEP_PARTITION_VERSIONS] if v != live]
+        for version in stale:
+            shutil.rmtree(os.path.join(ticker_dir, version), ignore_errors=True)
+        if live:
+            for name in os.listdir(ticker_dir):
+                if name.endswith(".npy"):
+                    os.remove(os.path.join(ticker_dir, name))
+
+    def _save_manifest(self):
+        if not self.root_dir:
+            return
+        manifest_path = os.path.join(self.root_dir, MANIFEST_FILE)
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._manifest, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+        self._manifest_mtime = os.stat(manifest_path).st_mtime_ns
+
+    def _refresh_manifest(self):
+        """Reload the manifest if another process (e.g. rebuild_database.py) replaced it."""
+        if not self.root_dir:
+            return
+        manifest_path = os.path.join(self.root_dir, MANIFEST_FILE)
+        try:
+            mtime = os.stat(manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"❌ Error reading stock store manifest: {e}")
+            return
+        for ticker in list(self._hot):
+            if manifest.get(ticker) != self._manifest.get(ticker):
+                self._drop(ticker)
+        self._manifest = manifest
+        self._manifest_mtime = mtime
+
+    # --- Lookup ---
+
+    def tickers(self):
+        """All tickers known to the store (loaded or not)."""
+        with self._lock:
+            self._refresh_manifest()
+            return list(self._manifest)
+
+    def hot_tickers(self):
+        """Tickers currently held in memory, least recently used first."""
+        with self._lock:
+            return list(self._hot)
+
+    def default_ticker(self):
+        with self._lock:
+            if DEFAULT_TICKER in self._manifest or not self._manifest:
+                return DEFAULT_TICKER
+            return next(iter(self._manifest))
+
+    def info(self, ticker):
+        with self._lock:
+            return self._manifest.get(ticker)
+
+    def get(self, ticker, freq="D"):
+        """
+        Return price bars for a ticker as a frame with a 'Date' column,
+        resampled to `freq` ('D', 'W', 'M' or 'Q'; None for the raw bars).
+        The partition is loaded on first use and resamples are cached.
+        """
+        with self._lock:
+            self._refresh_manifest()
+            compact = self._get_compact(ticker)
+            if compact is None or freq is None:
+                return compact
+            key = (ticker, freq)
+            if key not in self._resampled:
+                self._resampled[key] = resample_prices(compact, freq)
+            return self._resampled[key]
+
+    def _get_compact(self, ticker):
+        if ticker in self._hot:
+            self._hot.move_to_end(ticker)
+            return self._hot[ticker]
+        entry = self._manifest.get(ticker)
+        if entry is None:
+            return None
+
+        compact = self._load_partition(ticker, entry)
+        self._hot[ticker] = compact
+        while len(self._hot) > self.max_hot_tickers:
+            evicted = next(iter(self._hot))
+            self._drop(evicted)
+            print(f"♻️  Evicted stock partition {evicted} from memory")
+        return compact
+
+    def _load_partition(self, ticker, entry):
+        if self.root_dir:
+            partition_dir = self._partition_dir(ticker, entry.get("version"))
+            index = pd.DatetimeIndex(np.load(os.path.join(partition_dir, "index.npy")), name='Date')
+            compact = pd.DataFrame({
+                column: np.load(os.path.join(partition_dir, f"col_{i}.npy"))
+                for i, column in enumerate(entry["columns"])
+            }, index=index)
+        else:
+            frame = split_by_ticker(read_price_csv(entry["source"]), entry["source"])[ticker]
+            compact = compact_frame(frame)
+        print(f"Loaded stock data for {ticker} with {len(compact)} records")
+        print(f"Date range: {compact.index.min()} to {compact.index.max()}")
+        return compact
+
+    def _drop(self, ticker):
+        self._hot.pop(ticker, None)
+        for key in [k for k in self._resampled if k[0] == ticker]:
+            del self._resampled[key]
+
+    def evict(self, ticker=None):
+        """Drop one ticker (or all of them) and its cached resamples from memory."""
+        with self._lock:
+            if ticker is None:
+                self._hot.clear()
+                self._resampled.clear()
+            else:
+                self._drop(ticker)
+
+    def resolve_tickers(self, question):
+        """
+        Tickers mentioned in a question, in order of mention; the default
+        ticker if none. Known companies are matched even when no prices are
+        loaded for them, so callers can say so instead of answering for
+        another company.
+        """
+        question_lower = question.lower()
+        positions = {}
+        for ticker in dict.fromkeys(self.tickers() + list(COMPANY_TICKERS)):
+            aliases = [ticker.lower()]
+            if ticker in COMPANY_TICKERS:
+                aliases += COMPANY_TICKERS[ticker][1]
+            for alias in aliases:
+                match = re.search(r'\b' + re.escape(alias) + r'\b', question_lower)
+                if match and (ticker not in positions or match.start() < positions[ticker]):
+                    positions[ticker] = match.start()
+
+        if not positions:
+            return [self.default_ticker()]
+        return sorted(positions, key=positions.get)